@@ -0,0 +1,216 @@
+# Headless batch runner, streams beam definitions from JSON Lines or CSV and writes one JSON line of results per beam
+import sys
+import csv
+import json
+import argparse
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from Beam_Calculator import sing_calc, sing
+
+'''
+Each input record defines one beam:
+    id: optional - echoed back in the output
+    l: number - length of beam
+    E: number - Young's Modulous
+    I: number - 2nd moment of area, or give shape and dims instead (see sing_calc.I)
+    bc: list of {"loc": number, "type": "p"/"f"}
+    loading: list of {"coeff": number, "a": number, "pow": int} or [coeff, a, pow]
+In CSV files bc, loading, and list valued dims are JSON encoded strings
+
+Each output line has id, line (record number from 1), and either
+    reactions: {label: value}
+    extrema: {profile: {max, x_max, min, x_min}}
+    samples: {x: [...], profile: [...]} - only when samples are requested
+or
+    error: string - why the record could not be solved
+'''
+
+
+# Profile names that can be requested
+PROFILES = ['shear', 'moment', 'slope', 'deflection']
+
+
+# Yields (line number, record) from a JSON Lines or CSV stream without reading it all in
+def read_records(stream, file_format):
+    '''
+    INPUT:
+        stream: text file object
+        file_format: string - jsonl or csv
+    OUTPUT:
+        generator of (int, string or dict) - JSON Lines records are left as text so they are parsed by the workers
+    '''
+    if file_format == 'csv':
+        for i, row in enumerate(csv.DictReader(stream)):
+            yield i + 1, row
+    else:
+        line_number = 0
+        for line in stream:
+            if line.strip():
+                line_number += 1
+                yield line_number, line
+
+
+# Converts one input record into sing_calc arguments
+def parse_record(record):
+    '''
+    INPUT:
+        record: string (JSON) or dict (CSV row)
+    OUTPUT:
+        dict - sing_calc arguments plus the record id
+    '''
+    # JSON Lines records are text, CSV rows have JSON encoded cells
+    if isinstance(record, str):
+        record = json.loads(record)
+    else:
+        record = {key: decode_cell(value) for key, value in record.items() if value not in (None, '')}
+
+    # Second moment of area can be given directly or from the cross section
+    if 'I' in record:
+        I = float(record['I'])
+    elif 'shape' in record and 'dims' in record:
+        I = sing_calc.I(shape=record['shape'], dims=np.asarray(record['dims'], dtype=float))
+    else:
+        raise AttributeError('RECORD NEEDS I OR SHAPE AND DIMS')
+
+    # Loading terms as dicts or [coeff, a, pow] lists
+    loading = []
+    for term in record.get('loading', []):
+        if isinstance(term, dict):
+            loading.append(sing(**term))
+        else:
+            loading.append(sing(coeff=term[0], a=term[1], pow=term[2]))
+
+    return {
+        'id': record.get('id'),
+        'l': float(record['l']),
+        'E': float(record['E']),
+        'I': float(I),
+        'bc': [dict(i) for i in record['bc']],
+        'loading': loading,
+        }
+
+
+# Decodes a CSV cell that may hold a JSON number, list, or object
+def decode_cell(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+# Solves one record, errors are returned instead of raised so the batch keeps going
+def solve_record(line_number, record, profiles, samples):
+    '''
+    INPUT:
+        line_number: int - record number
+        record: string or dict - see read_records
+        profiles: list of strings - profiles to report
+        samples: int - number of evenly spaced points to sample each profile at, 0 for extrema only
+    OUTPUT:
+        dict - one output line
+    '''
+    result = {'id': None, 'line': line_number}
+    try:
+        args = parse_record(record)
+        result['id'] = args.pop('id')
+        calc = sing_calc(print_results=False, **args)
+
+        # Fields are collected apart from result so a failure part way through writes only the error
+        solved = {'reactions': {label: float(value) for label, value in calc.reactions.items()}, 'extrema': {}}
+        for profile in profiles:
+            extrema = calc.extrema(profile)
+            solved['extrema'][profile] = {key: float(extrema[key]) for key in ['max', 'x_max', 'min', 'x_min']}
+
+        if samples:
+            x = np.linspace(0, calc.l, samples)
+            solved['samples'] = {'x': x.tolist()}
+            for profile in profiles:
+                solved['samples'][profile] = calc.profiles[profile].value(x).tolist()
+
+        # nan and inf are not valid JSON, an unstable beam can give them
+        numbers = [list(solved['reactions'].values())] + [list(i.values()) for i in solved['extrema'].values()] + list(solved.get('samples', {}).values())
+        if not all(np.all(np.isfinite(i)) for i in numbers):
+            raise ValueError('SOLUTION IS NOT FINITE')
+        result.update(solved)
+
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+# Solves every record from the input stream and writes results in input order
+def run(records, output, profiles=PROFILES, samples=0, processes=1, window=None):
+    '''
+    INPUT:
+        records: iterable of (line number, record) - see read_records
+        output: text file object - where to write JSON lines
+        profiles: list of strings - profiles to report
+        samples: int - points to sample each profile at, 0 for extrema only
+        processes: int - worker processes, 1 solves in this process
+        window: optional int - most records in flight at once, bounds memory, defaults to 4 per process
+    OUTPUT:
+        (int, int) - number of records solved and number of errors
+    '''
+    counts = [0, 0]
+
+    # Write each result as soon as it is next in order
+    def write(result):
+        output.write(json.dumps(result, allow_nan=False) + '\n')
+        counts[0 if 'error' not in result else 1] += 1
+
+    if processes == 1:
+        for line_number, record in records:
+            write(solve_record(line_number, record, profiles, samples))
+    else:
+        window = window or 4 * processes
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            pending = deque()
+            for line_number, record in records:
+                pending.append(pool.submit(solve_record, line_number, record, profiles, samples))
+                if len(pending) >= window:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+
+    output.flush()
+    return counts[0], counts[1]
+
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve a stream of beam definitions without plotting')
+    parser.add_argument('input', nargs='?', default='-', help='JSON Lines or CSV file of beams, - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='file to write JSON Lines results to, - for stdout')
+    parser.add_argument('-f', '--format', choices=['jsonl', 'csv'], help='input format, defaults to the file extension or jsonl')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='number of worker processes')
+    parser.add_argument('-s', '--samples', type=int, default=0, help='points to sample each profile at, 0 for extrema only')
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='comma separated profiles to report')
+    args = parser.parse_args(argv)
+
+    profiles = [i.strip() for i in args.profiles.split(',') if i.strip()]
+    for profile in profiles:
+        if profile not in PROFILES:
+            parser.error(f'invalid profile {profile}, valid names are {", ".join(PROFILES)}')
+    file_format = args.format or ('csv' if args.input.lower().endswith('.csv') else 'jsonl')
+
+    # Stream input and output, nothing holds the whole file
+    stream = sys.stdin if args.input == '-' else open(args.input, newline='')
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        solved, errors = run(read_records(stream, file_format), output, profiles, args.samples, args.processes)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if output is not sys.stdout:
+            output.close()
+
+    print(f'Solved {solved} beams, {errors} errors', file=sys.stderr)
+    return 1 if errors else 0
+
+
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
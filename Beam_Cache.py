@@ -0,0 +1,186 @@
+# Saves solved beams to disk by a hash of their definition, so the same beam is never solved twice across runs
+import os
+import json
+import hashlib
+import tempfile
+import zipfile
+import numpy as np
+from Singularity_function import Singularity_function as sing
+from Singularity_equation import Singularity_equation as sing_eq
+
+'''
+INPUT:
+    directory
+        string
+        folder to keep cached solutions in, created if missing, can be shared by many processes
+    max_bytes
+        int
+        largest total size of the cached files, least recently used files are removed beyond it
+    verbose
+        bool
+        whether to dump cache activity to the console
+Use by passing to sing_calc:
+    cache = beam_cache('beam_cache')
+    sing_calc(l=l, I=I, E=E, bc=bc, loading=loading, cache=cache)
+'''
+
+
+class beam_cache():
+
+
+    # Changes whenever the stored arrays or the hashed fields change, old entries then simply stop matching
+    format_version = 1
+
+
+    def __init__(self, directory, max_bytes=256*2**20, verbose=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+
+    # Returns the sha256 of a beam's canonical definition, the same for any beam with the same l, E, I, supports, and loading
+    def key(self, calc):
+        '''
+        INPUT:
+            calc: sing_calc - beam with standardized support types and a canonical loading equation
+        OUTPUT:
+            string - hex digest
+        '''
+        # Floats are written in hex so every bit counts, loading terms are already sorted and merged by sing_eq
+        model = {
+            'version': self.format_version,
+            'l': float(calc.l).hex(),
+            'E': float(calc.E).hex(),
+            'I': float(calc.I).hex(),
+            'bc': [[float(supp['loc']).hex(), supp['type']] for supp in calc.bc], # Order kept, it sets the reaction labels
+            'loading': [[float(np.squeeze(s.coeff)).hex(), float(s.a).hex(), int(s.pow), bool(s.eval_all_a)] for s in calc.loading.sings],
+            }
+        return hashlib.sha256(json.dumps(model, separators=(',', ':')).encode()).hexdigest()
+
+
+    # Path of the file for a key
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+
+    # Returns a cached solution, or None on a miss
+    def load(self, key):
+        '''
+        INPUT:
+            key: string - see key
+        OUTPUT:
+            None or dict with fields
+                sols: 1D numpy array - solution of the support equations
+                labels: list of strings - label of each solution
+                deflection: sing_eq - E*I*deflection equation every profile is derived from
+        '''
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                cached = {
+                    'sols': data['sols'],
+                    'labels': data['labels'].tolist(),
+                    'deflection': sing_eq([sing(coeff=float(c), a=float(a), pow=int(p), eval_all_a=bool(e)) for c, a, p, e in zip(data['coeff'], data['a'], data['pow'], data['eval_all_a'])]),
+                    }
+            os.utime(path) # Mark as recently used for eviction
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile): # Missing, evicted by another process, or unreadable
+            self.misses += 1
+            self.vprint(f'Cache miss: {key}')
+            return None
+
+        self.hits += 1
+        self.vprint(f'Cache hit: {key}')
+        return cached
+
+
+    # Saves a solved beam, written to a temporary file then renamed so other processes never see a partial file
+    def store(self, key, calc):
+        '''
+        INPUT:
+            key: string - see key
+            calc: sing_calc - solved beam
+        '''
+        deflection = calc.deflection_equation()
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                np.savez(f,
+                    sols=np.asarray(calc.sols, dtype=float),
+                    labels=np.array(list(calc.reactions.keys())),
+                    coeff=np.array([float(np.squeeze(s.coeff)) for s in deflection.sings], dtype=float),
+                    a=np.array([s.a for s in deflection.sings], dtype=float),
+                    pow=np.array([s.pow for s in deflection.sings], dtype=int),
+                    eval_all_a=np.array([s.eval_all_a for s in deflection.sings], dtype=bool),
+                    )
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.vprint(f'Cache store: {key}')
+        self.evict()
+
+
+    # Removes the least recently used files until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError: # Removed by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(i[1] for i in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.vprint(f'Cache evict: {os.path.basename(path)}')
+            except FileNotFoundError: # Removed by another process
+                pass
+            total -= size
+
+
+    # Removes every cached file
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+    # Debug print statement, only prints when verbose set to true
+    def vprint(self, string):
+        if self.verbose:
+            print(string)
+
+
+
+
+
+# Test Function
+if __name__ == '__main__':
+    import time
+    from Beam_Calculator import sing_calc
+
+    cache = beam_cache(os.path.join(tempfile.gettempdir(), 'beam_cache_test'), verbose=True)
+    cache.clear()
+    beam = {
+        'l': 200.0,
+        'I': 1000,
+        'E': 10,
+        'loading': [sing(coeff=-1, a=0, pow=0)],
+        }
+
+    for run in range(2):
+        start = time.perf_counter()
+        calc = sing_calc(bc=[{'loc': float(i), 'type': 'p'} for i in range(201)], cache=cache, print_results=False, **beam)
+        print(f'Run {run}: {time.perf_counter() - start:.4f}s, max moment {calc.extrema("moment")["max_abs"]}')
+    print(f'Cache hits: {cache.hits}, misses: {cache.misses}')
@@ -2,17 +2,28 @@
 ## 12/18/2023
 ## This Class enables the calculations and interpretation of singularity functions
 
+import copy
+import json
+import struct
+import warnings
 import numpy as np
-from matplotlib import pyplot as plot
+from collections.abc import Mapping
 from Singularity_function import Singularity_function as sing
+from Singularity_function import integrate_terms, term_values
 from Singularity_equation import Singularity_equation as sing_eq
+from Singularity_equation import linspace_chunks
+from Instrumentation import phase, note
+
+
+# Profile order and the number of integrals of the loading each one is
+INTEGRALS = {'shear': 1, 'moment': 2, 'slope': 3, 'deflection': 4}
 
 
 class sing_calc():
 
 
     # By default, create a 1000mm long cantilevered beam with a moment of inertia from default values - DEPRICATE DEFAULT CASE LATER
-    def __init__(self, verbose=False, **kwargs):
+    def __init__(self, verbose=False, print_results=True, reactions_only=False, solver='dense', cache=None, **kwargs):
         '''
         INPUT: 
             l: numerical - length of beam
@@ -23,6 +34,12 @@ class sing_calc():
                 loc: x position from left
                 type: type of support (f/fixed, p/pinned)
             verbose: bool - whether to dump all calculation info to the console
+            print_results: bool - whether to dump the solution to the console, turn off for batch use
+            reactions_only: bool - only print the reactions, profiles are still built the first time they are accessed
+            solver: string - how the support equations are solved
+                dense: one equation per support condition, best for a few supports
+                sparse: banded node by node equations, best for long beams with many supports
+            cache: optional Beam_Cache.beam_cache - disk cache of solved beams, a hit skips solving
         ''' 
         # Bool to print out debug info
         self.verbose = verbose
@@ -51,29 +68,57 @@ class sing_calc():
         self.check_is_number(self.E, 'E')
         
         # Check boundary conditions
-        for i in range(len(self.bc)):
-            if self.bc[i]['type'].lower()[0] == 'p': # Pinned
-                    self.bc[i]['type'] = 'p' # Standardize name
-            elif self.bc[i]['type'].lower()[0] == 'f': # Fixed
-                self.bc[i]['type'] = 'f' # Standardize name
-            else: # Not pinned or fixed
-                raise AttributeError(f'INVALID FORMAT FOR SUPPORT {self.bc[i]}\nSupport type must be either p/pinned or f/fixed')
-
-            self.check_is_number(self.bc[i]['loc'], f'Boundary condition {self.bc[i]} location')     
+        self.check_supports(self.bc)
         
         ## Check loading
+        self.loading = self.check_loading(self.loading)
+
+        ## Check solver
+        if solver not in ('dense', 'sparse'):
+            raise AttributeError(f'INVALID SOLVER {solver}, VALID SOLVERS ARE: \n\tdense\n\tsparse')
+        self.solver = solver
+        self.cache = cache
+
+        ## Solve Reactions
+        self.reactions_only = reactions_only
+        self.solve_reactions(print_results=print_results)
+
+
+    # Checks each support's location and standardizes its type in place
+    def check_supports(self, bc):
+        '''
+        INPUT:
+            bc: list of dictionaries with the location and type of each support
+        '''
+        for i in range(len(bc)):
+            if bc[i]['type'].lower()[0] == 'p': # Pinned
+                    bc[i]['type'] = 'p' # Standardize name
+            elif bc[i]['type'].lower()[0] == 'f': # Fixed
+                bc[i]['type'] = 'f' # Standardize name
+            else: # Not pinned or fixed
+                raise AttributeError(f'INVALID FORMAT FOR SUPPORT {bc[i]}\nSupport type must be either p/pinned or f/fixed')
+
+            self.check_is_number(bc[i]['loc'], f'Boundary condition {bc[i]} location')
+
+
+    # Checks a loading argument and packages it into a singularity equation
+    def check_loading(self, loading):
+        '''
+        INPUT:
+            loading: sing_eq or iterable of Singularity_function objects
+        OUTPUT:
+            sing_eq - the loading as a singularity equation
+        '''
         # If passed lis of sing functions, package into sing_eq
-        if not(type(self.loading) == sing_eq or hasattr(self.loading, '__iter__')):
+        if not(type(loading) == sing_eq or hasattr(loading, '__iter__')):
             raise AttributeError(f'INVALID FORMAT FOR LOADING\nLoading should be a Singularity_equation object or an iterable of Singularity_functions')
-        if hasattr(self.loading, '__iter__'):
-            self.loading = sing_eq(self.loading)
+        if hasattr(loading, '__iter__'):
+            loading = sing_eq(loading)
         # Check each sing function
-        for i in range(len(self.loading.sings)):
-            self.check_is_number(self.loading.sings[i].coeff, f'Loading sing funct {self.loading.sings[i]} coeff')
-            self.check_is_number(self.loading.sings[i].a, f'Loading sing funct {self.loading.sings[i]} a value')
-
-        ## Solve Reactions
-        self.solve_reactions()
+        for i in range(len(loading.sings)):
+            self.check_is_number(loading.sings[i].coeff, f'Loading sing funct {loading.sings[i]} coeff')
+            self.check_is_number(loading.sings[i].a, f'Loading sing funct {loading.sings[i]} a value')
+        return loading
 
 
     # Checks if a variable is numeric
@@ -95,146 +140,358 @@ class sing_calc():
         INPUTS:
             print_results: bool - Whether to dump solutions to the console
         '''
-        # Preallocate reaction info
-        supp_sings = [] # List of singularity functions corresponding to a support or an integration constant
-        supp_labels = [] # List of names of each reaction in B and columns of A in order
-        n_fixed = 0 # Number of fixed supports
-        x_fixed = [] # List of locations of fixed supports
-        
-        ## Unpack general information
-        # x values of all supports
-        x_supp = [i['loc'] for i in self.bc]
+        # A cached solution of the same beam skips building the support equations entirely
+        key = self.cache.key(self) if self.cache is not None else None
+        cached = self.cache.load(key) if key is not None else None
+        if cached is not None:
+            self.set_solution(cached['sols'], cached['labels'])
+            self.deflection_sing_eq = cached['deflection']
 
-        # Process reaction info, for each support:
-        #   - Classify support type
-        #   - Add singularity function to a list that corresponds to the proportion of the reaction force/moment used for each equation row
-        #   - Add reaction force/moment labels to a list of labels to decode later
-        #   - Add list of points to evaluate equations at (0 and L for v and m, at each fixed support for y', at each support for y)
-        # Build list of singularity functions to populate matrix, list of labels for columns, list of points to build equations at
-        for i, supp in enumerate(self.bc):
-            
-            # Sanitize Support dict arguments
-            try:
-                # Ensure dict arguments exist
-                supp['loc']
-                supp['type']
-            except: # dict arguments not found
-                raise AttributeError(f'INVALID FORMAT FOR SUPPORT\nSupport must be a dictionary with key pairs:\n\t\"loc\" corresponding to the x value of the support from the left\n\t\"type\" corresponding to the type of support(f/p for fixed/pinned)')
-            
-            # Make sure support is the correct type
-            if supp['type'] == 'p':
-                
-                # Add to list for equations, label list
-                supp_sings.append(sing(coeff=1, a=supp['loc'], pow=-1))
-                supp_labels.append(f'Fr{i}')
-            
-            elif supp['type'] == 'f':
-                
-                # Keep track of fixed supports for y' equations
-                n_fixed = n_fixed + 1
-                x_fixed.append(supp['loc'])
+        else:
+            # Build the support equations, evaluate the loading, and solve Ax + B = 0
+            system = self.support_system()
+            B = system.rhs([self.loading])
+            with phase('solve'):
+                sols = system.solve(B)[:, 0]
+            self.set_solution(sols)
+            if key is not None:
+                self.cache.store(key, self)
 
-                # Add to list for equations, label list
-                supp_sings.append(sing(coeff=1, a=supp['loc'], pow=-1))
-                supp_sings.append(sing(coeff=1, a=supp['loc'], pow=-2))
-                supp_labels.append(f'Fr{i}')
-                supp_labels.append(f'Mr{i}')
-            
-        # Add integration constant info to supp lists
-        supp_sings += [sing(coeff=1, a=0, pow=-1-i  , eval_all_a=True) for i in range(4)]
-        supp_labels += ['C_shear', 'C_moment', 'C_y_slope', 'C_y']
+        # Print Output
+        if print_results:
+            self.print_results()
 
-        ## Build singularity equation for loads
-        loading_sing = self.loading.copy()
 
-        # List of lists of x values to evaluate for each integration
-        # v, m  -> Evaluated at beam start and end
-        # y' -> Evaluated at fixed suppports
-        # y -> Evaluated at all supports
-        x_eval = 2*[[0, self.l]]+ [x_fixed] + [x_supp]
+    # Solves many loadings on the same beam and supports, reusing one factorization of the support equations
+    def solve_load_cases(self, loadings, print_results=False):
+        '''
+        INPUTS:
+            loadings: iterable of loadings - each a sing_eq or iterable of Singularity_function objects
+            print_results: bool - Whether to dump each case's solutions to the console
+        OUTPUTS:
+            list of sing_calc - one solved calculator per loading, with reactions and profiles
+        '''
+        loadings = [self.check_loading(loading) for loading in loadings]
 
-        # Count total number of equations that need to be evaluated
-        n_equations = sum([len(i) for i in x_eval])
-        
-        # Preallocate A, B
-        # A matrix to store reaction forces.
-        #   Cols: F1, M1, F2, M2, ... Fn, Mn, Cv, Cm, Cyp, Cy -> Mi only if pinned, see labels vector
-        #   Rows: V(x1)...V(xn), M(x1)...V(xn), y'(x1)...y'(xn), y(x1)...y(xn)
-        # B matrix to store loading forces for the relation: Ax + B = 0
-        A = np.zeros([n_equations, n_equations])
-        B = np.zeros([n_equations, 1])
+        # All cases are solved together as columns of B
+        system = self.support_system()
+        B = system.rhs(loadings)
+        with phase('solve'):
+            sols = system.solve(B)
 
+        # Package each case as its own calculator sharing this beam's supports
+        cases = []
+        for i, loading in enumerate(loadings):
+            case = copy.copy(self)
+            case.loading = loading
+            case.set_solution(sols[:, i])
+            if print_results:
+                case.print_results()
+            cases.append(case)
+        return cases
 
-        # For each integral:
-        #   - Evaluate list of support singularity functions (includes Cs) at each x position and fill in A matrix row
-        #   - Evaluate load singularity function  at each x position and fill in B value
-        #   - Integrate support and load singularity functions
-        working_row = 0
-        divide_factors = [1,1,self.E*self.I, self.E*self.I]
+
+    # Influence lines of a unit point load moving along the beam, all load positions are solved as one batch
+    def influence_lines(self, positions, x=None, profiles=('shear', 'moment', 'slope', 'deflection'), magnitude=1):
+        '''
+        INPUTS:
+            positions: iterable - x positions of the moving point load
+            x: optional numpy array - the x values to evaluate the profiles on
+            profiles: iterable of strings - names of the profiles to return
+            magnitude: numerical - coefficient of the point load, same sign convention as loading
+        OUTPUTS:
+            dict with fields
+                positions: 1D numpy array - load positions
+                x: 1D numpy array - x values of the profiles
+                labels: list of strings - names of the reactions, columns of reactions
+                reactions: 2D numpy array (positions x reactions) - reaction influence lines
+                <profile name>: 2D numpy array (positions x x) - profile for the load at each position
+                peak: dict of 1D numpy arrays - largest magnitude value of each profile per position (signed)
+                peak_x: dict of 1D numpy arrays - location of each peak
+        '''
+        positions = np.asarray(positions, dtype=float).reshape(-1)
+        if x is None:
+            x = np.linspace(0, self.l, 1000)
+        x = np.asarray(x, dtype=float).reshape(-1)
+
+        # One point load term per position, B has one column per position
+        load_coeff = np.full(positions.size, float(magnitude))
+        load_pow = np.full(positions.size, -1)
+        system = self.support_system()
+        sols = system.solve(system.rhs_terms(load_coeff, positions, load_pow))
+
+        results = {
+            'positions': positions,
+            'x': x,
+            'labels': list(system.labels),
+            'reactions': sols.T,
+            'peak': {},
+            'peak_x': {},
+            }
+
+        # Each profile is the solved reactions times the support terms plus the load term, at the profile's integral
         integral_names = ['shear', 'moment', 'slope', 'deflection']
-        for i, integral_locs in enumerate(x_eval):
-            
-            # Integrate functions to current row
-            for s in supp_sings:
-                s.integrate()
-            loading_sing.integrate()
-
-            # For each x position per integral
-            #   - Check if the location to evaluate is 0 (limit approaching from the left)
-            #   - Evaluate supp_sings and populate the corresponding row of the A matrix
-            #   - Evaluate loading_sing and populate the corresponding element of the B matrix
-            for x in integral_locs:
-                if x == 0:
-                    limit_direction = 'negative'
-                else:
-                    limit_direction = 'positive'
-                
-                reaction_sing_value_list = [s.value(x, direction=limit_direction)/divide_factors[i] for s in supp_sings]
+        for name in profiles:
+            if name not in integral_names:
+                raise AttributeError('INVALID PROFILE NAME, VALID NAMES ARE: \n\tshear\n\tmoment\n\tslope\n\tdeflection')
+            i = integral_names.index(name)
+            supp_coeff, supp_a, supp_pow, supp_eval_all_a = system.packed_terms(i + 1)
+            coeff, pow = integrate_terms(load_coeff, load_pow, i + 1)
+            values = sols.T @ system.term_matrix(x, supp_coeff, supp_a, supp_pow, supp_eval_all_a)
+            values += system.term_matrix(x, coeff, positions, pow, np.zeros(positions.size, dtype=bool))
+            values /= system.divide_factors[i]
 
-                # Add fixture singularity functions, integration constant, and Loading singularity function equations to the matrices
-                A[working_row, :] = reaction_sing_value_list
-                B[working_row] = loading_sing.value(x, direction=limit_direction)/divide_factors[i]
-                working_row += 1
+            # Largest magnitude per load position
+            peak_index = np.argmax(np.abs(values), axis=1)
+            results[name] = values
+            results['peak'][name] = values[np.arange(positions.size), peak_index]
+            results['peak_x'][name] = x[peak_index]
 
-        # Solve Reactions
-        sols = np.linalg.solve(A, -B)
-        
-        # Build list for c singularity functions
-        C_sing_list = [sing(coeff=1, a=0, pow=i) for i in range(4)]
-        
-        # Combine coefficients with sing equations and add loading sing equation for the full deflection sing equation
-        deflection_sing_eq = sing_eq([i[0].copy()*i[1].copy() for i in zip(supp_sings + C_sing_list, sols)]) + loading_sing
+        return results
 
-        # Remove sing functions that have coefficients of zero, 2 loops to prevent issues in incorrect orders
-        to_remove = []
-        for sing_i in deflection_sing_eq.sings:
-            try:
-                coeff = sing_i.coeff[0]
-            except:
-                coeff = sing_i.coeff
-            self.vprint(f'Coeff: {coeff}')
-            if coeff == 0:
-                self.vprint(f'\tREMOVING')
-                to_remove.append(sing_i)
-        for sing_i in to_remove:
-            deflection_sing_eq.delete_sing(sing_i)
-
-        # Save full singularity equations
-        integral_names.reverse() # Start with deflection, reverse to derivitave back to shear
-        divide_factors.reverse()
-        self.profiles = {}
-        for i, name in enumerate(integral_names):
-            self.profiles[name] = deflection_sing_eq.copy() / divide_factors[i]
-            deflection_sing_eq.derivative()
 
-        # Print Output
-        if print_results:
-            print(f'Reactions')
-            for i, label in enumerate(supp_labels):
-                print(f'\t{label}: {sols[i]}')
-            print(f'Profiles:')
-            for profile in self.profiles.keys():
-                print(f'\n{profile}: \n{self.profiles[profile]}')
+    # Adds loads to the beam, the change in reactions is solved for the added loads alone and superposed on the current solution
+    def add_load(self, loading):
+        '''
+        INPUTS:
+            loading: Singularity_function, sing_eq, or iterable of Singularity_function objects - loads to add
+        '''
+        self.update_loading(self.load_terms(loading))
+
+
+    # Removes loads from the beam by superposing their negative, each one is subtracted from the like term (same a, power, and eval_all_a) of the loading
+    def remove_load(self, loading):
+        '''
+        INPUTS:
+            loading: Singularity_function, sing_eq, or iterable of Singularity_function objects - loads to remove
+        '''
+        self.update_loading([i * -1 for i in self.matched_terms(loading)])
+
+
+    # Moves one load to a new location, solved as removing it and adding it at a
+    def move_load(self, load, a):
+        '''
+        INPUTS:
+            load: Singularity_function - load to move, must match a term of the loading
+            a: numerical - new location of the load
+        '''
+        self.check_is_number(a, 'Load location')
+        terms = self.matched_terms(load)
+        if not terms: # Zero loads are dropped from the loading, so there is nothing to move
+            raise ValueError(f'LOAD {load} NOT FOUND IN LOADING')
+        moved = terms[0]
+        self.update_loading([moved * -1, sing(coeff=moved.coeff, a=a, pow=moved.pow, eval_all_a=moved.eval_all_a)])
+
+
+    # Checks every load has a like term in the loading to be subtracted from, like loads are merged so only a, power, and eval_all_a are matched
+    def matched_terms(self, loading):
+        current = {sing_eq.sort_key(i) for i in self.loading.sings}
+        terms = self.load_terms(loading)
+        for i in terms:
+            if sing_eq.sort_key(i) not in current:
+                raise ValueError(f'LOAD {i} NOT FOUND IN LOADING')
+        return terms
+
+
+    # Checks the loads of an edit and returns them as a list of Singularity_function objects
+    def load_terms(self, loading):
+        if isinstance(loading, sing):
+            loading = [loading]
+        return list(self.check_loading(loading).sings)
+
+
+    # Superposes the solution for a change in loading on the current solution, reusing the factorized support equations
+    def update_loading(self, terms):
+        '''
+        INPUTS:
+            terms: list of Singularity_function objects - change in loading
+        '''
+        change = sing_eq(terms)
+        system = self.support_system()
+        B = system.rhs([change])
+        with phase('solve'):
+            sols = self.sols + system.solve(B)[:, 0]
+
+        # A new loading equation so copies of this beam, ex: load cases, keep theirs, profiles are rebuilt when next accessed
+        self.loading = self.loading.copy() + change
+        self.set_solution(sols)
+
+
+    # Moves a support or changes its type, the current factorization is reused through a low rank update when few equations change
+    def change_support(self, index, loc=None, type=None):
+        '''
+        INPUTS:
+            index: int - position of the support in bc
+            loc: optional numerical - new location of the support
+            type: optional string - new type of the support (f/fixed, p/pinned)
+        '''
+        bc = [dict(supp) for supp in self.bc]
+        if loc is not None:
+            bc[index]['loc'] = loc
+        if type is not None:
+            bc[index]['type'] = type
+        self.update_supports(bc)
+
+
+    # Adds a support after the existing ones, so the labels of existing reactions do not change
+    def add_support(self, loc, type):
+        self.update_supports([dict(supp) for supp in self.bc] + [{'loc': loc, 'type': type}])
+
+
+    # Removes a support, reactions of the supports after it are relabeled
+    def remove_support(self, index):
+        bc = [dict(supp) for supp in self.bc]
+        del bc[index]
+        self.update_supports(bc)
+
+
+    # Rebuilds the support equations for edited supports and solves the current loading on them
+    def update_supports(self, bc):
+        '''
+        INPUTS:
+            bc: list of dictionaries with the location and type of each support, a copy that is not shared with other beams
+        '''
+        self.check_supports(bc)
+        if self.solver == 'sparse': # The banded factorization is cheap enough to redo
+            system = sparse_support_system(bc, self.l, self.E, self.I)
+        else:
+            system = support_system(bc, self.l, self.E, self.I, base=getattr(self, '_system', None))
+        self.bc = bc
+        self._system = system
+        B = system.rhs([self.loading])
+        with phase('solve'):
+            sols = system.solve(B)[:, 0]
+        self.set_solution(sols)
+
+
+    # Returns the support equations for this beam, built and factorized once
+    def support_system(self):
+        if getattr(self, '_system', None) is None:
+            if self.solver == 'sparse':
+                self._system = sparse_support_system(self.bc, self.l, self.E, self.I)
+            else:
+                self._system = support_system(self.bc, self.l, self.E, self.I)
+        return self._system
+
+
+    # Saves reactions, the shear, moment, slope, and deflection profiles are built from them when first accessed
+    def set_solution(self, sols, labels=None):
+        '''
+        INPUTS:
+            sols: 1D numpy array - solution to the support equations, ordered like support_system().labels
+            labels: optional list of strings - label of each solution, defaults to support_system().labels
+        '''
+        if labels is None:
+            labels = self.support_system().labels
+        self.sols = sols
+        self.reactions = dict(zip(labels, sols))
+        self.deflection_sing_eq = None
+        self.profiles = lazy_profiles(self.build_profile)
+
+
+    # Returns the singularity equation of E*I*deflection that every profile is derived from, built once per solution
+    def deflection_equation(self):
+        if self.deflection_sing_eq is None:
+            system = self.support_system()
+
+            # Combine coefficients with sing equations and add loading sing equation for the full deflection sing equation
+            # Adding keeps the equation canonical, which merges like terms and removes sing functions that have coefficients of zero
+            with phase('deflection_equation'):
+                loading_sing = self.loading.copy().integrate(4)
+                self.deflection_sing_eq = sing_eq([i[0].integrate(4)*i[1] for i in zip(system.supp_sings, self.sols)]) + loading_sing
+            note('deflection_terms', len(self.deflection_sing_eq))
+            self.vprint(f'Deflection equation: \n{self.deflection_sing_eq}')
+
+        return self.deflection_sing_eq
+
+
+    # Builds one profile from the deflection equation, derivitave back from deflection to shear
+    def build_profile(self, name):
+        n_derivatives = lazy_profiles.names.index(name)
+        divide_factors = [self.E*self.I, self.E*self.I, 1, 1]
+        profile = self.deflection_equation().copy()
+        with phase('profiles'):
+            for i in range(n_derivatives):
+                profile.derivative()
+            return profile / divide_factors[n_derivatives]
+
+
+    # Dumps reactions and profiles to the console
+    def print_results(self):
+        print(f'Reactions')
+        for label in self.reactions.keys():
+            print(f'\t{label}: {self.reactions[label]}')
+        if self.reactions_only:
+            return
+        print(f'Profiles:')
+        for profile in self.profiles.keys():
+            print(f'\n{profile}: \n{self.profiles[profile]}')
+
+
+    # Returns the exact extrema of a profile along the beam
+    def extrema(self, profile):
+        '''
+        INPUTS:
+            profile: string - the name of the profile (shear, moment, slope, deflection)
+        OUTPUTS:
+            dict with fields max, x_max, min, x_min, max_abs, x_max_abs - see Piecewise_polynomial.extrema
+        '''
+        return self.get_profile(profile).extrema(0, self.l)
+
+
+    # Returns the exact locations along the beam where a profile crosses zero
+    def zeros(self, profile):
+        '''
+        INPUTS:
+            profile: string - the name of the profile (shear, moment, slope, deflection)
+        OUTPUTS:
+            1D numpy array - sorted x values
+        '''
+        return self.get_profile(profile).zeros(0, self.l)
+
+
+    # Returns a profile by name with a helpful error for invalid names
+    def get_profile(self, profile):
+        try: # Check profile name
+            return self.profiles[profile]
+        except KeyError:
+            raise AttributeError('INVALID PROFILE NAME, VALID NAMES ARE: \n\tshear\n\tmoment\n\tslope\n\tdeflection')
+
+
+    # Yields profiles over an evenly spaced grid along the beam one block at a time, for exports too large to hold in memory
+    def iter_profiles(self, num, profiles=None, chunk_size=None):
+        '''
+        INPUTS:
+            num: int - number of evenly spaced points from 0 to l inclusive, same points as np.linspace(0, l, num)
+            profiles: optional iterable of strings - profile names, defaults to all four
+            chunk_size: optional int - points per block, see Singularity_equation.iter_values
+        OUTPUTS:
+            generator of (x, values) for each block in order
+                x: 1D numpy array
+                values: dict of 1D numpy arrays by profile name
+        '''
+        equations = {name: self.get_profile(name) for name in (profiles or self.profiles.keys())}
+        for x in linspace_chunks(0, self.l, num, chunk_size or sing_eq.stream_chunk):
+            yield x, {name: equation.value(x) for name, equation in equations.items()}
+
+
+    # Writes profiles over an evenly spaced grid to a memory mapped .npy file block by block
+    def to_npy(self, path, num, profiles=None, chunk_size=None):
+        '''
+        INPUTS:
+            path: string - .npy file to write, holds a structured array with field x and one field per profile
+            num, profiles, chunk_size: see iter_profiles
+        '''
+        names = list(profiles or self.profiles.keys())
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=[('x', float)] + [(name, float) for name in names], shape=(int(num),))
+        i = 0
+        for x, values in self.iter_profiles(num, names, chunk_size):
+            out['x'][i:i + x.size] = x
+            for name in names:
+                out[name][i:i + x.size] = values[name]
+            i += x.size
+        out.flush()
+        del out
 
 
     # Plots out value
@@ -254,10 +511,13 @@ class sing_calc():
         except:
             raise AttributeError('INVALID PROFILE NAME FOR PLOTTING, VALID NAMES ARE: \n\tshear\n\tmoment\n\tslope\n\tdeflection')
         
-        # Check and assign missing optionals
-        if not x:
-            x = np.linspace(0, self.l, 1000)
+        # Check and assign missing optionals, default x includes the exact max and min so peaks are not cut off
+        if x is None:
+            extrema = self.extrema(profile)
+            x = np.union1d(np.linspace(0, self.l, 1000), [extrema['x_max'], extrema['x_min']])
         if not fig:
+            # matplotlib is only loaded when plotting so the numeric code imports without it
+            from matplotlib import pyplot as plot
             fig = plot
 
         # Plot profile, and centerline
@@ -288,6 +548,77 @@ class sing_calc():
             fig.set_ylabel('y[m]')
 
 
+    # Binary layout: header of magic and metadata length, JSON metadata padded to 8 bytes, solution array, loading equation, deflection equation
+    binary_header = struct.Struct('<4s4xQ')
+    binary_magic = b'SGC1'
+
+
+    # Returns the solved beam as bytes that from_bytes reads back exactly: inputs, solution, and the equation every profile comes from
+    def to_bytes(self):
+        metadata = json.dumps({
+            'l': float(self.l),
+            'E': float(self.E),
+            'I': float(self.I),
+            'bc': [{'loc': float(supp['loc']), 'type': supp['type']} for supp in self.bc],
+            'labels': list(self.reactions.keys()),
+            'solver': self.solver,
+            'reactions_only': self.reactions_only,
+            }).encode()
+        metadata += b' ' * (-len(metadata) % 8)
+        return b''.join([
+            self.binary_header.pack(self.binary_magic, len(metadata)),
+            metadata,
+            np.asarray(self.sols, dtype='<f8').tobytes(),
+            self.loading.to_bytes(),
+            self.deflection_equation().to_bytes(),
+            ])
+
+
+    # Reads a solved beam written by to_bytes without solving it again, arrays are views of buffer where possible
+    @staticmethod
+    def from_bytes(buffer, verbose=False):
+        '''
+        INPUTS:
+            buffer: bytes, bytearray, memoryview, or memory mapped file
+            verbose: bool - whether to dump calculation info to the console
+        OUTPUTS:
+            sing_calc - solved, with the same reactions and profiles as the beam that was written
+        '''
+        magic, length = sing_calc.binary_header.unpack_from(buffer, 0)
+        if magic != sing_calc.binary_magic:
+            raise Exception('BUFFER DOES NOT HOLD A SOLVED BEAM')
+        offset = sing_calc.binary_header.size
+        metadata = json.loads(bytes(buffer[offset:offset + length]))
+        offset += length
+        sols = np.frombuffer(buffer, dtype='<f8', count=len(metadata['labels']), offset=offset)
+        offset += sols.nbytes
+        loading, offset = sing_eq.read_bytes(buffer, offset)
+        deflection, offset = sing_eq.read_bytes(buffer, offset)
+
+        # The stored solution is handed over through the cache interface so the beam is checked but never solved
+        calc = sing_calc(
+            l=metadata['l'], E=metadata['E'], I=metadata['I'], bc=metadata['bc'], loading=loading,
+            solver=metadata['solver'], reactions_only=metadata['reactions_only'], verbose=verbose, print_results=False,
+            cache=known_solution(sols, metadata['labels'], deflection),
+            )
+        calc.cache = None
+        return calc
+
+
+    # Pickles leave out the support equations, they are large, can hold factorizations that cannot be pickled, and are rebuilt when needed
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_system', None)
+        return state
+
+
+    # Shallow copies still share the support equations, so load cases of one beam reuse its factorization
+    def __copy__(self):
+        new = type(self).__new__(type(self))
+        new.__dict__.update(self.__dict__)
+        return new
+
+
     # Debug print statement, only prints when verbose set to true
     def vprint(self, string):
         if self.verbose:
@@ -325,8 +656,672 @@ class sing_calc():
 
 
 
+# Hands an already known solution to sing_calc through the same interface as Beam_Cache.beam_cache
+class known_solution():
+
+
+    def __init__(self, sols, labels, deflection):
+        self.solution = {'sols': sols, 'labels': labels, 'deflection': deflection}
+
+
+    def key(self, calc):
+        return 'known'
+
+
+    def load(self, key):
+        return self.solution
+
+
+    def store(self, key, calc):
+        pass
+
+
+
+
+
+# Returns scipy.linalg, or None if scipy is not installed. scipy is optional and slow to import so it is loaded on first use
+def scipy_linalg():
+    global _scipy_linalg
+    if _scipy_linalg is False:
+        try:
+            import scipy.linalg as _scipy_linalg
+        except ImportError: # solve with numpy instead
+            _scipy_linalg = None
+    return _scipy_linalg
+
+
+_scipy_linalg = False # Not loaded yet
+
+
+# Returns scipy.sparse and scipy.sparse.linalg, or None if scipy is not installed, loaded on first use like scipy_linalg
+def scipy_sparse():
+    global _scipy_sparse
+    if _scipy_sparse is False:
+        try:
+            import scipy.sparse
+            import scipy.sparse.linalg
+            _scipy_sparse = scipy.sparse
+        except ImportError: # solve densely instead
+            _scipy_sparse = None
+    return _scipy_sparse
+
+
+_scipy_sparse = False # Not loaded yet
+
+
+# Raises the error np.linalg.solve gives for a singular system when a factorization has a zero or non finite pivot, e.g. an unstable beam
+def check_pivots(pivots):
+    if np.any(pivots == 0) or not np.all(np.isfinite(pivots)):
+        raise np.linalg.LinAlgError('Singular matrix')
+
+
+
+
+
+# Profiles of a solved beam by name, each one is built the first time it is accessed
+class lazy_profiles(Mapping):
+
+
+    # Profile names in the order they are derived from the deflection equation
+    names = ['deflection', 'slope', 'moment', 'shear']
+
+
+    def __init__(self, build):
+        '''
+        INPUT:
+            build: function - takes a profile name and returns its singularity equation
+        '''
+        self.build = build
+        self.built = {}
+
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        if name not in self.built:
+            self.built[name] = self.build(name)
+        return self.built[name]
+
+
+    def __iter__(self):
+        return iter(self.names)
+
+
+    def __len__(self):
+        return len(self.names)
+
+
+
+
+
+# Equations relating the reactions of a beam's supports to its loading, depends only on the supports, l, E, and I
+class support_system():
+
+
+    # Largest low rank update, as a fraction of the number of equations, before a new factorization is cheaper
+    update_rank_limit = 0.25
+
+
+    def __init__(self, bc, l, E, I, base=None):
+        '''
+        INPUT:
+            bc: iterable of dictionaries with the location and standardized type (f/p) of each support
+            l: numerical - length of beam
+            E: numerical - Young's Modulous [Pa]
+            I: numerical - 2nd moment of area (I) of the beam [m^4]
+            base: optional support_system - equations of the same beam before its supports were edited, its factorization is reused when few equations changed
+        '''
+        self.build_terms(bc, l, E, I)
+
+        # Count total number of equations that need to be evaluated
+        n_equations = sum([len(i) for i in self.x_eval])
+        
+        # Preallocate A
+        # A matrix to store reaction forces.
+        #   Cols: F1, M1, F2, M2, ... Fn, Mn, Cv, Cm, Cyp, Cy -> Mi only if pinned, see labels vector
+        #   Rows: V(x1)...V(xn), M(x1)...V(xn), y'(x1)...y'(xn), y(x1)...y(xn)
+        self.A = np.zeros([n_equations, n_equations])
+
+        # For each integral:
+        #   - Integrate all support singularity functions (includes Cs) together as packed arrays
+        #   - Evaluate every support term at every x position of the integral in one broadcast and fill in those rows of A
+        note('equations', n_equations)
+        note('support_terms', len(self.supp_sings))
+        coeff, a, pow, eval_all_a = self.packed
+        working_row = 0
+        for i, integral_locs in enumerate(self.x_eval):
+            with phase('integration'):
+                coeff, pow = integrate_terms(coeff, pow)
+            with phase('assembly'):
+                n_locs = len(integral_locs)
+                self.A[working_row:working_row + n_locs, :] = self.term_matrix(integral_locs, coeff, a, pow, eval_all_a, limit=True).T/self.divide_factors[i]
+                working_row += n_locs
+
+        # Reuse the factorization A was edited from through a low rank update, otherwise factorize A once so every loading reuses it
+        self.lu = None
+        self.update = None
+        if base is not None:
+            with phase('low_rank_update'):
+                self.update = self.low_rank_update(base)
+        if self.update is None:
+            with phase('factorization'):
+                linalg = scipy_linalg()
+                if linalg is not None:
+                    with warnings.catch_warnings(): # Singular systems are raised as errors below
+                        warnings.simplefilter('ignore', linalg.LinAlgWarning)
+                        self.lu = linalg.lu_factor(self.A)
+                    check_pivots(np.diag(self.lu[0]))
+
+
+    # Builds the support and integration constant terms, their labels, and the locations each integral is constrained at
+    def build_terms(self, bc, l, E, I):
+        # Preallocate reaction info
+        self.supp_sings = [] # List of singularity functions corresponding to a support or an integration constant
+        self.labels = [] # List of names of each reaction in B and columns of A in order
+        self.bc = [] # Copy of each support's location and type
+        x_fixed = [] # List of locations of fixed supports
+        fixed_labels = [] # Names of the slope equations at fixed supports
+        
+        ## Unpack general information
+        # x values of all supports
+        x_supp = [i['loc'] for i in bc]
+
+        # Process reaction info, for each support:
+        #   - Classify support type
+        #   - Add singularity function to a list that corresponds to the proportion of the reaction force/moment used for each equation row
+        #   - Add reaction force/moment labels to a list of labels to decode later
+        #   - Add list of points to evaluate equations at (0 and L for v and m, at each fixed support for y', at each support for y)
+        # Build list of singularity functions to populate matrix, list of labels for columns, list of points to build equations at
+        for i, supp in enumerate(bc):
+            
+            # Sanitize Support dict arguments
+            try:
+                # Ensure dict arguments exist
+                supp['loc']
+                supp['type']
+            except: # dict arguments not found
+                raise AttributeError(f'INVALID FORMAT FOR SUPPORT\nSupport must be a dictionary with key pairs:\n\t\"loc\" corresponding to the x value of the support from the left\n\t\"type\" corresponding to the type of support(f/p for fixed/pinned)')
+            
+            self.bc.append({'loc': supp['loc'], 'type': supp['type']})
+
+            # Make sure support is the correct type
+            if supp['type'] == 'p':
+                
+                # Add to list for equations, label list
+                self.supp_sings.append(sing(coeff=1, a=supp['loc'], pow=-1))
+                self.labels.append(f'Fr{i}')
+            
+            elif supp['type'] == 'f':
+                
+                # Keep track of fixed supports for y' equations
+                x_fixed.append(supp['loc'])
+                fixed_labels.append(f'y_slope{i}')
+
+                # Add to list for equations, label list
+                self.supp_sings.append(sing(coeff=1, a=supp['loc'], pow=-1))
+                self.supp_sings.append(sing(coeff=1, a=supp['loc'], pow=-2))
+                self.labels.append(f'Fr{i}')
+                self.labels.append(f'Mr{i}')
+            
+        # Add integration constant info to supp lists
+        self.supp_sings += [sing(coeff=1, a=0, pow=-1-i  , eval_all_a=True) for i in range(4)]
+        self.labels += ['C_shear', 'C_moment', 'C_y_slope', 'C_y']
+
+        # Support term parameters as arrays (coeff, a, pow, eval_all_a), integrated together for each row of A
+        self.packed = (
+            np.array([s.coeff for s in self.supp_sings], dtype=float),
+            np.array([s.a for s in self.supp_sings], dtype=float),
+            np.array([s.pow for s in self.supp_sings], dtype=int),
+            np.array([s.eval_all_a for s in self.supp_sings], dtype=bool),
+            )
+
+        # List of lists of x values to evaluate for each integration
+        # v, m  -> Evaluated at beam start and end
+        # y' -> Evaluated at fixed suppports
+        # y -> Evaluated at all supports
+        self.x_eval = 2*[[0, l]]+ [x_fixed] + [x_supp]
+        self.divide_factors = [1, 1, E*I, E*I]
+
+        # Names of each equation in rows of A and B in order, equations of a support keep their name when other supports are edited
+        self.row_labels = ['shear_start', 'shear_end', 'moment_start', 'moment_end'] + fixed_labels + [f'y{i}' for i in range(len(x_supp))]
+
+
+    # Evaluate the loading at each equation's location to build B, one column per loading
+    def rhs(self, loadings):
+        '''
+        INPUT:
+            loadings: list of sing_eq - loading of each case
+        OUTPUT:
+            B: 2D numpy array (equations x cases) for the relation: Ax + B = 0
+        '''
+        B = np.zeros([self.A.shape[0], len(loadings)])
+        with phase('rhs'):
+            for j, loading in enumerate(loadings):
+                note('load_terms', len(loading))
+
+                # Pack the load terms ordered by power like a compiled equation, so terms are summed in the same order as loading.value
+                terms = sorted(loading.sings, key=lambda s: s.pow)
+                load_coeff = np.array([float(np.squeeze(s.coeff)) for s in terms], dtype=float)
+                load_a = np.array([s.a for s in terms], dtype=float)
+                load_pow = np.array([s.pow for s in terms], dtype=int)
+                load_eval_all_a = np.array([s.eval_all_a for s in terms], dtype=bool)
+
+                # Integrate load terms to each row's integral and evaluate at all of its locations at once
+                working_row = 0
+                for i, integral_locs in enumerate(self.x_eval):
+                    coeff, pow = integrate_terms(load_coeff, load_pow, i + 1)
+                    n_locs = len(integral_locs)
+                    B[working_row:working_row + n_locs, j] = self.term_matrix(integral_locs, coeff, load_a, pow, load_eval_all_a, limit=True).sum(axis=0)/self.divide_factors[i]
+                    working_row += n_locs
+        return B
+
+
+    # Build B for loadings that are each a single singularity function, evaluated for all terms at once
+    def rhs_terms(self, coeff, a, pow, eval_all_a=None):
+        '''
+        INPUT:
+            coeff, a, pow: 1D numpy arrays - parameters of the loading term of each case
+            eval_all_a: optional 1D bool array - eval_all_a of each case's term, defaults to False
+        OUTPUT:
+            B: 2D numpy array (equations x cases) for the relation: Ax + B = 0
+        '''
+        a = np.asarray(a, dtype=float)
+        eval_all_a = np.zeros(a.size, dtype=bool) if eval_all_a is None else np.broadcast_to(np.asarray(eval_all_a, dtype=bool), a.shape)
+        B = np.zeros([self.A.shape[0], a.size])
+        working_row = 0
+        for i, integral_locs in enumerate(self.x_eval):
+            integral_coeff, integral_pow = integrate_terms(coeff, pow, i + 1)
+            n_locs = len(integral_locs)
+            B[working_row:working_row + n_locs, :] = self.term_matrix(integral_locs, integral_coeff, a, integral_pow, eval_all_a, limit=True).T/self.divide_factors[i]
+            working_row += n_locs
+        return B
+
+
+    # Returns the coefficient, a, power, and eval_all_a arrays of the support terms after n integrations
+    def packed_terms(self, n):
+        coeff, a, pow, eval_all_a = self.packed
+        coeff, pow = integrate_terms(coeff, pow, n)
+        return coeff, a, pow, eval_all_a
+
+
+    # Evaluates each term at each x, terms with negative powers are zero
+    @staticmethod
+    def term_matrix(x, coeff, a, pow, eval_all_a, limit=False, direction='positive'):
+        '''
+        INPUT:
+            x: iterable - points to evaluate at
+            coeff, a, pow, eval_all_a: 1D numpy arrays - parameters of each term
+            limit: bool - whether to take the limit from the left at x = 0 like the support equations, otherwise from the right
+            direction: string - limit direction used when x = a at every other point
+        OUTPUT:
+            2D numpy array (terms x points)
+        '''
+        x = np.asarray(x, dtype=float).reshape(-1)
+        values = np.zeros([len(coeff), x.size])
+
+        # Only terms with powers of 0 or more can be nonzero, ordered by power so term_values does not reorder them again
+        pow = np.asarray(pow)
+        rows = np.flatnonzero(pow >= 0)
+        rows = rows[np.argsort(pow[rows], kind='stable')]
+        if rows.size == 0 or x.size == 0:
+            return values
+        terms = (coeff[rows], a[rows], pow[rows], eval_all_a[rows])
+
+        # Points at x = 0 take the limit from the left when asked
+        negative = np.flatnonzero(x == 0) if limit else np.zeros(0, dtype=int)
+        if negative.size == 0:
+            values[rows] = term_values(x, *terms, direction=direction)
+        else:
+            positive = np.flatnonzero(x != 0)
+            values[rows[:, np.newaxis], negative] = term_values(x[negative], *terms, direction='negative')
+            values[rows[:, np.newaxis], positive] = term_values(x[positive], *terms, direction=direction)
+        return values
+
+
+    # Solve Ax + B = 0 for every column of B
+    def solve(self, B):
+        if self.update is not None:
+            return self.update_solve(B)
+        if self.lu is not None:
+            return scipy_linalg().lu_solve(self.lu, -B)
+        return np.linalg.solve(self.A, -B)
+
+
+    # Writes A as a factorized system plus a low rank change, returns None when a new factorization is cheaper or the systems do not line up
+    def low_rank_update(self, base):
+        '''
+        INPUT:
+            base: support_system - equations of the same beam with different supports
+        OUTPUT:
+            None or dict used by update_solve, A = A_root + U Vt once both are padded to the same unknowns and equations
+        '''
+        # Updates always start from a factorized system so they never chain, and only supports may differ
+        root = base.update['root'] if getattr(base, 'update', None) is not None else base
+        if type(root) is not support_system or root.lu is None or root.x_eval[0] != self.x_eval[0] or root.divide_factors != self.divide_factors:
+            return None
+        changed = [i for i in range(max(len(root.bc), len(self.bc))) if i >= len(root.bc) or i >= len(self.bc) or root.bc[i] != self.bc[i]]
+
+        # Unknowns and equations of both systems by name, this system's first then those only the root has
+        new_cols, new_rows = set(self.labels), set(self.row_labels)
+        old_cols, old_rows = set(root.labels), set(root.row_labels)
+        cols = self.labels + [label for label in root.labels if label not in new_cols]
+        rows = self.row_labels + [label for label in root.row_labels if label not in new_rows]
+        if len(cols) != len(rows):
+            return None
+        n, m = len(cols), len(self.labels)
+        col_of = {label: j for j, label in enumerate(cols)}
+        row_of = {label: j for j, label in enumerate(rows)}
+        root_cols = np.array([col_of[label] for label in root.labels], dtype=int)
+        root_rows = np.array([row_of[label] for label in root.row_labels], dtype=int)
+
+        # Each system is padded with unit equations pairing the unknowns and equations only the other one has, which leaves its solution unchanged
+        everything = np.arange(n)
+        new_index = np.where(everything < m, everything, -1)
+        new_pairs = np.where(everything < m, -1, everything)
+        root_row_index = np.full(n, -1)
+        root_row_index[root_rows] = np.arange(root_rows.size)
+        root_col_index = np.full(n, -1)
+        root_col_index[root_cols] = np.arange(root_cols.size)
+        root_pairs = np.full(n, -1)
+        pad_rows = np.array([row_of[label] for label in self.row_labels if label not in old_rows], dtype=int)
+        pad_cols = np.array([col_of[label] for label in self.labels if label not in old_cols], dtype=int)
+        root_pairs[pad_rows] = pad_cols
+
+        # Only the columns of edited supports' reactions and the rows of their equations differ, every other entry is the same term at the same point
+        changed_cols = np.array([col_of[label] for i in changed for label in (f'Fr{i}', f'Mr{i}') if label in col_of], dtype=int)
+        changed_rows = np.array([row_of[label] for i in changed for label in (f'y_slope{i}', f'y{i}') if label in row_of], dtype=int)
+        if changed_cols.size + changed_rows.size > self.update_rank_limit * n:
+            return None
+        col_part = self.padded_block(self.A, new_index, new_index, new_pairs, everything, changed_cols) - self.padded_block(root.A, root_row_index, root_col_index, root_pairs, everything, changed_cols)
+        row_part = self.padded_block(self.A, new_index, new_index, new_pairs, changed_rows, everything) - self.padded_block(root.A, root_row_index, root_col_index, root_pairs, changed_rows, everything)
+        row_part[:, changed_cols] = 0
+
+        # Woodbury identity: A^-1 = A_root^-1 - A_root^-1 U (I + Vt A_root^-1 U)^-1 Vt A_root^-1
+        U = np.zeros([n, changed_cols.size + changed_rows.size])
+        U[:, :changed_cols.size] = col_part
+        U[changed_rows, changed_cols.size + np.arange(changed_rows.size)] = 1
+        Vt = np.zeros([changed_cols.size + changed_rows.size, n])
+        Vt[np.arange(changed_cols.size), changed_cols] = 1
+        Vt[changed_cols.size:] = row_part
+        update = {'root': root, 'n': n, 'root_rows': root_rows, 'root_cols': root_cols, 'pad_rows': pad_rows, 'pad_cols': pad_cols, 'Vt': Vt}
+        update['W'] = self.root_inverse(update, U)
+        linalg = scipy_linalg()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', linalg.LinAlgWarning)
+            update['capacitance'] = linalg.lu_factor(np.eye(U.shape[1]) + Vt @ update['W'])
+        if np.any(np.diag(update['capacitance'][0]) == 0) or not np.all(np.isfinite(update['capacitance'][0])): # A itself may be singular, factorizing it says so
+            return None
+        return update
+
+
+    # Entries of a padded system at union rows r and columns c, see low_rank_update
+    @staticmethod
+    def padded_block(A, row_index, col_index, pairs, r, c):
+        '''
+        INPUT:
+            A: 2D numpy array - equations of the system
+            row_index, col_index: 1D int arrays - row and column of A at each union row and column, -1 where A has none
+            pairs: 1D int array - union column each padding row has a unit entry in, -1 for rows of A
+            r, c: 1D int arrays - union rows and columns to return
+        OUTPUT:
+            2D numpy array (r x c)
+        '''
+        block = A[row_index[r][:, np.newaxis], col_index[c]]
+        block[(row_index[r] < 0)[:, np.newaxis] | (col_index[c] < 0)] = 0
+        block[pairs[r][:, np.newaxis] == c] = 1
+        return block
+
+
+    # Multiplies by the inverse of the padded root system of a low rank update
+    @staticmethod
+    def root_inverse(update, b):
+        x = np.zeros(b.shape)
+        x[update['root_cols']] = update['root'].solve(-b[update['root_rows']])
+        x[update['pad_cols']] = b[update['pad_rows']]
+        return x
+
+
+    # Solve Ax + B = 0 through the factorization of the root system and the low rank update, refined once against A to recover the accuracy of a direct solve
+    def update_solve(self, B):
+        B = np.asarray(B, dtype=float)
+        x = self.update_apply(-B)
+        x -= self.update_apply(self.A @ x + B)
+        return x
+
+
+    # Multiplies by the inverse of A using the Woodbury identity
+    def update_apply(self, B):
+        b = np.zeros([self.update['n'], B.shape[1]])
+        b[:B.shape[0]] = B
+        x = self.root_inverse(self.update, b)
+        x -= self.update['W'] @ scipy_linalg().lu_solve(self.update['capacitance'], self.update['Vt'] @ x)
+        return x[:B.shape[0]]
+
+
+    # Equations at the beam start are the limit approaching from the left
+    @staticmethod
+    def limit_direction(x):
+        if x == 0:
+            return 'negative'
+        return 'positive'
+
+
+
+
+# Support equations reformulated node by node so the system is banded, for long beams with many supports
+class sparse_support_system(support_system):
+    '''
+    Unknowns are the integration constants, then for each node (support locations, 0, and l in order):
+        state just left of the node, reactions at the node, state just right of the node
+    where a state is (V, M, E*I*slope, E*I*y). Equations at each node:
+        transfer: the left state equals the previous right state carried across the unloaded span, plus the loading's change
+        jump: the right state equals the left state plus the node's reactions, plus the loading's jump
+        constraints: zero V and M at the beam ends, zero slope at fixed supports, zero deflection at all supports
+    Each equation only touches its own and the previous node's unknowns, so the factorization cost grows linearly with supports
+    solve returns the same unknowns in the same order as support_system
+    '''
+
+
+    def __init__(self, bc, l, E, I):
+        '''
+        INPUT:
+            bc: iterable of dictionaries with the location and standardized type (f/p) of each support
+            l: numerical - length of beam
+            E: numerical - Young's Modulous [Pa]
+            I: numerical - 2nd moment of area (I) of the beam [m^4]
+        '''
+        self.build_terms(bc, l, E, I)
+        sparse = scipy_sparse()
+
+        # Nodes are every distinct support location plus the beam ends
+        self.nodes = np.unique(np.array([0, l] + [supp['loc'] for supp in bc], dtype=float))
+        node_of = {x: k for k, x in enumerate(self.nodes.tolist())}
+        reactions = [[] for i in self.nodes] # Labels index of each reaction at each node
+        for j, label in enumerate(self.labels[:-4]):
+            reactions[node_of[float(self.supp_sings[j].a)]].append(j)
+
+        # Columns: integration constants, then left state, reactions, right state of each node
+        self.left = np.zeros(self.nodes.size, dtype=int)
+        self.right = np.zeros(self.nodes.size, dtype=int)
+        self.unknowns = np.zeros(len(self.labels), dtype=int) # Column of each support_system unknown
+        self.unknowns[-4:] = np.arange(4)
+        column = 4
+        for k, node_reactions in enumerate(reactions):
+            self.left[k] = column
+            column += 4
+            for j in node_reactions:
+                self.unknowns[j] = column
+                column += 1
+            self.right[k] = column
+            column += 4
+        n_equations = column
+        note('equations', n_equations)
+        note('support_terms', len(self.supp_sings))
+
+        with phase('assembly'):
+            rows, cols, vals = [], [], []
+            def add(row, col, val):
+                rows.append(row)
+                cols.append(col)
+                vals.append(val)
+
+            # Constraint rows are (node, side, state component), the same conditions as the rows of support_system
+            constraints = [(node_of[0.0], 'left', 0), (node_of[0.0], 'left', 1), (node_of[float(l)], 'right', 0), (node_of[float(l)], 'right', 1)]
+            for supp in bc:
+                side = 'left' if supp['loc'] == 0 else 'right'
+                if supp['type'] == 'f':
+                    constraints.append((node_of[float(supp['loc'])], side, 2))
+                constraints.append((node_of[float(supp['loc'])], side, 3))
+            constraints_at = [[] for i in self.nodes]
+            for node, side, component in constraints:
+                constraints_at[node].append((side, component))
+
+            # Rows in node order keep the matrix banded
+            row = 0
+            self.transfer_rows = np.zeros(self.nodes.size, dtype=int)
+            self.jump_rows = np.zeros(self.nodes.size, dtype=int)
+            for k in range(self.nodes.size):
+                # Left state from the constants at the first node, from the previous right state after that
+                self.transfer_rows[k] = row
+                if k == 0:
+                    previous, T = 0, self.transfer(self.nodes[0])
+                else:
+                    previous, T = self.right[k-1], self.transfer(self.nodes[k] - self.nodes[k-1])
+                for m in range(4):
+                    add(row + m, self.left[k] + m, 1.0)
+                    for n in range(m + 1):
+                        add(row + m, previous + n, -T[m, n])
+                row += 4
+
+                # Reaction forces jump V, reaction moments jump M
+                self.jump_rows[k] = row
+                for m in range(4):
+                    add(row + m, self.right[k] + m, 1.0)
+                    add(row + m, self.left[k] + m, -1.0)
+                for j in reactions[k]:
+                    add(row + (0 if self.supp_sings[j].pow == -1 else 1), self.unknowns[j], -1.0)
+                row += 4
+
+                for side, component in constraints_at[k]:
+                    add(row, (self.left if side == 'left' else self.right)[k] + component, 1.0)
+                    row += 1
+
+            if sparse is not None:
+                self.A = sparse.csc_matrix((vals, (rows, cols)), shape=(n_equations, n_equations))
+            else: # Without scipy the same equations are solved densely
+                self.A = np.zeros([n_equations, n_equations])
+                np.add.at(self.A, (rows, cols), vals)
+
+        # Factorize A once so every loading reuses it
+        with phase('factorization'):
+            if sparse is not None:
+                try:
+                    self.lu = sparse.linalg.splu(self.A)
+                except RuntimeError: # Exactly singular
+                    raise np.linalg.LinAlgError('Singular matrix')
+                check_pivots(self.lu.U.diagonal())
+            else:
+                self.lu = None
+
+
+    # Evaluate the loading's state at each node to build B, one column per loading
+    def rhs(self, loadings):
+        '''
+        INPUT:
+            loadings: list of sing_eq - loading of each case
+        OUTPUT:
+            B: 2D numpy array (equations x cases) for the relation: Ax + B = 0
+        '''
+        left = np.zeros([4, self.nodes.size, len(loadings)])
+        right = np.zeros([4, self.nodes.size, len(loadings)])
+        with phase('rhs'):
+            for j, loading in enumerate(loadings):
+                note('load_terms', len(loading))
+                coeff = np.array([float(np.squeeze(s.coeff)) for s in loading.sings], dtype=float)
+                a = np.array([s.a for s in loading.sings], dtype=float)
+                pow = np.array([s.pow for s in loading.sings], dtype=int)
+                eval_all_a = np.array([s.eval_all_a for s in loading.sings], dtype=bool)
+                left[:, :, j], right[:, :, j] = (i.sum(axis=1) for i in self.load_states(coeff, a, pow, eval_all_a))
+            return self.load_rhs(left, right)
+
+
+    # Build B for loadings that are each a single singularity function, evaluated for all terms at once
+    def rhs_terms(self, coeff, a, pow, eval_all_a=None):
+        '''
+        INPUT:
+            coeff, a, pow: 1D numpy arrays - parameters of the loading term of each case
+            eval_all_a: optional 1D bool array - eval_all_a of each case's term, defaults to False
+        OUTPUT:
+            B: 2D numpy array (equations x cases) for the relation: Ax + B = 0
+        '''
+        a = np.asarray(a, dtype=float)
+        eval_all_a = np.zeros(a.size, dtype=bool) if eval_all_a is None else np.broadcast_to(np.asarray(eval_all_a, dtype=bool), a.shape)
+        left, right = self.load_states(np.asarray(coeff, dtype=float), a, np.asarray(pow, dtype=int), eval_all_a)
+        return self.load_rhs(np.swapaxes(left, 1, 2), np.swapaxes(right, 1, 2))
+
+
+    # Returns the state (V, M, E*I*slope, E*I*y) of each loading term just left and right of each node
+    def load_states(self, coeff, a, pow, eval_all_a):
+        '''
+        OUTPUT:
+            left, right: 3D numpy arrays (state components x terms x nodes)
+        '''
+        left = np.zeros([4, coeff.size, self.nodes.size])
+        right = np.zeros([4, coeff.size, self.nodes.size])
+        for m in range(4):
+            coeff_m, pow_m = integrate_terms(coeff, pow, m + 1)
+            rows = pow_m >= 0
+            if rows.any():
+                terms = (coeff_m[rows], a[rows], pow_m[rows], eval_all_a[rows])
+                left[m, rows] = term_values(self.nodes, *terms, direction='negative')
+                right[m, rows] = term_values(self.nodes, *terms)
+        return left, right
+
+
+    # Right hand side of every equation from the loading's state at each node, constraint rows are zero
+    def load_rhs(self, left, right):
+        '''
+        INPUT:
+            left, right: 3D numpy arrays (state components x nodes x cases) - loading's state at each node
+        OUTPUT:
+            B: 2D numpy array (equations x cases) for the relation: Ax + B = 0
+        '''
+        B = np.zeros([self.A.shape[0], left.shape[2]])
+        previous = np.concatenate([np.zeros([4, 1, left.shape[2]]), right[:, :-1]], axis=1)
+        transfers = np.stack([self.transfer(d) for d in np.diff(self.nodes, prepend=0.0)])
+
+        # The loading alone satisfies the same transfer and jump equations as the full state
+        B[self.transfer_rows[:, np.newaxis] + np.arange(4)] = -(left - np.einsum('kmn,nkc->mkc', transfers, previous)).transpose(1, 0, 2)
+        B[self.jump_rows[:, np.newaxis] + np.arange(4)] = -(right - left).transpose(1, 0, 2)
+        return B
+
+
+    # Solve Ax + B = 0 for every column of B, returns the support_system unknowns
+    def solve(self, B):
+        if self.lu is not None:
+            x = self.lu.solve(np.asarray(-B, dtype=float))
+        else:
+            x = np.linalg.solve(self.A, -B)
+        return x[self.unknowns]
+
+
+    # Carries a state (V, M, E*I*slope, E*I*y) across an unloaded span of length d
+    @staticmethod
+    def transfer(d):
+        return np.array([
+            [1, 0, 0, 0],
+            [d, 1, 0, 0],
+            [d**2/2, d, 1, 0],
+            [d**3/6, d**2/2, d, 1],
+            ], dtype=float)
+
+
+
+
+
 # Test Function
 if __name__ == '__main__':
+    from matplotlib import pyplot as plot
     
     # Functional test Ex 1 in notebook
     l = 3 #[m]
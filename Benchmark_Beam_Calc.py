@@ -0,0 +1,289 @@
+# Benchmarks for the calculator, run as a script to print timings, save baselines, and compare against them
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import numpy as np
+from Singularity_function import Singularity_function as sing
+from Singularity_function import jit_kernels, set_backend
+from Singularity_equation import Singularity_equation as sing_eq
+from Beam_Calculator import sing_calc
+
+
+# Modules that make up the numeric core, none of them should load matplotlib
+CORE_MODULES = ['Singularity_function', 'Singularity_equation', 'Beam_Calculator']
+
+
+# Times importing each module in a fresh interpreter and records whether it pulled in matplotlib
+def benchmark_imports(modules=CORE_MODULES, repeats=5):
+    '''
+    INPUT:
+        modules: iterable of strings - module names to import
+        repeats: int - fresh interpreters per module, the fastest is kept
+    OUTPUT:
+        dict by module name with fields
+            seconds: float - fastest import time
+            matplotlib: bool - whether matplotlib was imported as a side effect
+    '''
+    script = (
+        'import sys, time, json\n'
+        'start = time.perf_counter()\n'
+        'import {module}\n'
+        'seconds = time.perf_counter() - start\n'
+        'print(json.dumps({{"seconds": seconds, "matplotlib": "matplotlib" in sys.modules}}))\n'
+        )
+    results = {}
+    for module in modules:
+        runs = []
+        for i in range(repeats):
+            output = subprocess.run([sys.executable, '-c', script.format(module=module)], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            runs.append(json.loads(output.stdout))
+        results[module] = {
+            'seconds': min(i['seconds'] for i in runs),
+            'matplotlib': any(i['matplotlib'] for i in runs),
+            }
+    return results
+
+
+# Returns a list of problems with the import benchmark, empty if it passes
+def check_imports(results, budget):
+    '''
+    INPUT:
+        results: dict - output of benchmark_imports
+        budget: float - most seconds any module may take to import
+    OUTPUT:
+        list of strings - one per failed check
+    '''
+    problems = []
+    for module, result in results.items():
+        if result['matplotlib']:
+            problems.append(f'{module} imports matplotlib')
+        if result['seconds'] > budget:
+            problems.append(f'{module} took {result["seconds"]:.3f}s to import, budget is {budget:.3f}s')
+    return problems
+
+
+# Registered benchmark cases as (name, params, setup), setup takes the params and returns the function to time
+CASES = []
+
+
+# Registers a benchmark case once per set of parameters
+def case(name, params=({},)):
+    def register(setup):
+        for param in params:
+            CASES.append((name, dict(param), setup))
+        return setup
+    return register
+
+
+# Continuous beam with evenly spaced pinned supports and a distributed load, used by the solve and profile cases
+def continuous_beam(spans):
+    l = float(spans)
+    return {
+        'l': l,
+        'E': 200*10**9,
+        'I': sing_calc.I(shape='circle', dims=0.05),
+        'bc': [{'loc': float(i), 'type': 'p'} for i in range(spans + 1)],
+        'loading': [sing(coeff=-1000.0, a=0, pow=0), sing(coeff=-5000.0, a=l/3, pow=-1)],
+        }
+
+
+# Equation with terms spread along a beam, powers like a deflection profile
+def spread_equation(terms):
+    rng = np.random.default_rng(0)
+    return sing_eq([sing(coeff=float(c), a=float(a), pow=int(p)) for c, a, p in zip(rng.normal(size=terms), np.linspace(0, 10, terms), rng.integers(0, 4, terms))])
+
+
+@case('function_value_scalar', [{'points': 1000}])
+def setup_function_value_scalar(points):
+    term = sing(coeff=2.0, a=5, pow=3)
+    x = np.linspace(0, 10, points).tolist()
+    return lambda: [term.value(i) for i in x]
+
+
+@case('function_value_array', [{'points': 1000}, {'points': 100000}])
+def setup_function_value_array(points):
+    term = sing(coeff=2.0, a=5, pow=3)
+    x = np.linspace(0, 10, points)
+    return lambda: term.value(x)
+
+
+@case('equation_value', [{'terms': t, 'points': p} for t in [10, 100, 1000] for p in [1000, 100000]])
+def setup_equation_value(terms, points):
+    equation = spread_equation(terms)
+    x = np.linspace(0, 10, points)
+    equation.value(x[:1]) # Compile outside the timing
+    return lambda: equation.value(x)
+
+
+@case('solve_reactions', [{'spans': s} for s in [1, 10, 100, 500]])
+def setup_solve_reactions(spans):
+    return lambda: sing_calc(print_results=False, **continuous_beam(spans))
+
+
+@case('solve_reactions_sparse', [{'spans': s} for s in [10, 100, 500, 2000]])
+def setup_solve_reactions_sparse(spans):
+    return lambda: sing_calc(print_results=False, solver='sparse', **continuous_beam(spans))
+
+
+@case('build_profiles', [{'spans': s} for s in [1, 10, 100, 500]])
+def setup_build_profiles(spans):
+    calc = sing_calc(print_results=False, **continuous_beam(spans))
+    def run():
+        calc.set_solution(calc.sols) # Clears the cached profiles
+        for name in calc.profiles:
+            calc.profiles[name]
+    return run
+
+
+@case('plot', [{'spans': s} for s in [1, 10]])
+def setup_plot(spans):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plot
+    calc = sing_calc(print_results=False, **continuous_beam(spans))
+    def run():
+        fig = plot.figure()
+        calc.plot('moment', fig=fig.add_subplot(1, 1, 1))
+        fig.canvas.draw()
+        plot.close(fig)
+    return run
+
+
+# Times a function, repeating until each sample runs for at least min_time
+def measure(function, repeats=5, min_time=0.05):
+    '''
+    INPUT:
+        function: callable - the code to time
+        repeats: int - number of samples
+        min_time: float - least seconds per sample, fast functions are looped
+    OUTPUT:
+        dict with fields seconds (median per call), min, max, loops, repeats
+    '''
+    # One untimed call pays one time costs (lazy imports, numba cache loads and compiles) so they are not timed
+    function()
+
+    # Find how many loops make one sample long enough, the calibration runs are not kept as samples
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        for j in range(loops):
+            function()
+        samples.append((time.perf_counter() - start) / loops)
+    return {'seconds': float(np.median(samples)), 'min': min(samples), 'max': max(samples), 'loops': loops, 'repeats': repeats}
+
+
+# Name of a case with its parameters, used as the key in saved results
+def case_key(name, params):
+    return name + ''.join(f'[{key}={value}]' for key, value in params.items())
+
+
+# Runs every registered case whose key contains the filter
+def run_cases(name_filter='', repeats=5, min_time=0.05, verbose=True):
+    '''
+    OUTPUT:
+        dict by case key - see measure
+    '''
+    results = {}
+    for name, params, setup in CASES:
+        key = case_key(name, params)
+        if name_filter not in key:
+            continue
+        results[key] = measure(setup(**params), repeats, min_time)
+        if verbose:
+            print(f'\t{key}: {results[key]["seconds"]*1000:.3f}ms')
+    return results
+
+
+# Info saved with results so baselines from different machines or commits can be told apart
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(), 'commit': commit, 'backend': 'numpy' if jit_kernels() is None else 'numba'}
+
+
+# Compares results to a saved baseline, returns a list of cases that got slower than the tolerance allows
+def compare(results, baseline, tolerance):
+    '''
+    INPUT:
+        results: dict - output of run_cases
+        baseline: dict - results loaded from a saved file
+        tolerance: float - largest allowed ratio of new time to baseline time
+    OUTPUT:
+        list of strings - one per regression
+    '''
+    regressions = []
+    print('Compared to baseline:')
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        # Fastest samples are compared, they are the least affected by other load on the machine
+        ratio = result.get('min', result['seconds']) / baseline[key].get('min', baseline[key]['seconds'])
+        print(f'\t{key}: {ratio:.2f}x')
+        if ratio > tolerance:
+            regressions.append(f'{key} is {ratio:.2f}x slower than baseline')
+    return regressions
+
+
+# Command line entry point
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the singularity function calculator')
+    parser.add_argument('-k', '--filter', default='', help='only run cases whose name contains this text')
+    parser.add_argument('--repeats', type=int, default=5, help='samples per case, and fresh interpreters per import timing')
+    parser.add_argument('--min-time', type=float, default=0.05, help='least seconds per sample')
+    parser.add_argument('--import-budget', type=float, default=0.25, help='most seconds a core module may take to import')
+    parser.add_argument('--save', help='JSON file to save results to as a baseline')
+    parser.add_argument('--compare', help='JSON baseline file to compare results against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='largest allowed slowdown ratio when comparing')
+    parser.add_argument('--skip-imports', action='store_true', help='skip the import time benchmark')
+    parser.add_argument('--backend', default='auto', choices=['auto', 'numba', 'numpy'], help='how terms are evaluated, see Singularity_function.set_backend')
+    args = parser.parse_args(argv)
+
+    problems = []
+    results = {}
+    if not args.skip_imports:
+        imports = benchmark_imports(repeats=args.repeats)
+        print('Import times:')
+        for module, result in imports.items():
+            print(f'\t{module}: {result["seconds"]*1000:.1f}ms{" (loads matplotlib)" if result["matplotlib"] else ""}')
+            results[f'import[module={module}]'] = {'seconds': result['seconds'], 'matplotlib': result['matplotlib']}
+        problems += check_imports(imports, args.import_budget)
+
+    set_backend(args.backend)
+    print(f'Cases ({environment()["backend"]} backend):')
+    results.update(run_cases(args.filter, args.repeats, args.min_time))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f'Saved results to {args.save}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            problems += compare(results, json.load(f)['results'], args.tolerance)
+
+    for problem in problems:
+        print(f'FAILED: {problem}')
+    return 1 if problems else 0
+
+
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# Opt in timing and counters for the calculator, nothing is recorded unless a recording is active
+import time
+from contextlib import contextmanager, nullcontext
+
+'''
+Usage:
+    with recording() as stats:
+        sing_calc(...)
+    print(stats)
+
+Phases recorded by the calculator:
+    integration: integrating support terms for each row of the support equations
+    assembly: filling the support equation matrix A
+    factorization: factorizing A
+    low_rank_update: expressing an edited A as a change to an already factorized A instead of factorizing it
+    rhs: evaluating loadings into B
+    solve: solving Ax + B = 0
+    deflection_equation: building the E*I*deflection singularity equation
+    cleanup: putting singularity equations in canonical form (merging like terms, dropping zero terms)
+    profiles: deriving a profile from the deflection equation
+Values noted by the calculator:
+    equations: number of rows (and columns) of A
+    support_terms: number of support and integration constant terms
+    load_terms: number of terms in a loading
+    deflection_terms: number of terms in the deflection equation
+Counts kept while recording:
+    Singularity_function.value, Singularity_equation.value: number of calls
+    term_evaluations: number of term values (terms x points) computed from packed term arrays, the bulk of the work in equation values and support equations
+'''
+
+
+# Recordings that are currently active, innermost last. Empty means instrumentation is off
+_active = []
+
+# Shared do nothing context returned by phase when nothing is recording
+_no_phase = nullcontext()
+
+
+class stats():
+
+
+    # Aggregated timings, counts, and noted values of one recording
+    def __init__(self, callback=None):
+        '''
+        INPUT:
+            callback: optional function - called as callback(kind, name, value) for every event as it happens
+                kind: string - phase, count, or note
+                name: string - name of the phase, counter, or value
+                value: seconds for phases, increment for counts, the value for notes
+        '''
+        self.callback = callback
+        self.phases = {} # name: {'calls': int, 'seconds': float}
+        self.counts = {} # name: int
+        self.notes = {} # name: {'last': value, 'max': value}
+
+
+    # Adds the time of one call to a phase
+    def add_phase(self, name, seconds):
+        entry = self.phases.setdefault(name, {'calls': 0, 'seconds': 0.0})
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        if self.callback is not None:
+            self.callback('phase', name, seconds)
+
+
+    # Increments a counter
+    def add_count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+        if self.callback is not None:
+            self.callback('count', name, n)
+
+
+    # Keeps the last and largest of a noted value
+    def add_note(self, name, value):
+        entry = self.notes.setdefault(name, {'last': value, 'max': value})
+        entry['last'] = value
+        entry['max'] = max(entry['max'], value)
+        if self.callback is not None:
+            self.callback('note', name, value)
+
+
+    # Returns everything recorded as plain dicts, ex: for saving as JSON
+    def as_dict(self):
+        return {'phases': {k: dict(v) for k, v in self.phases.items()}, 'counts': dict(self.counts), 'notes': {k: dict(v) for k, v in self.notes.items()}}
+
+
+    # Table of phases by total time, then counts and noted values
+    def __str__(self):
+        output = 'Phases:\n'
+        for name, entry in sorted(self.phases.items(), key=lambda i: -i[1]['seconds']):
+            output += f'\t{name}: {entry["seconds"]*1000:.3f}ms over {entry["calls"]} calls\n'
+        output += 'Counts:\n'
+        for name, n in self.counts.items():
+            output += f'\t{name}: {n}\n'
+        output += 'Values:\n'
+        for name, entry in self.notes.items():
+            output += f'\t{name}: {entry["last"]} (max {entry["max"]})\n'
+        return output.strip('\n')
+
+
+
+
+
+# Records everything the calculator does inside the with block
+@contextmanager
+def recording(callback=None):
+    '''
+    INPUT:
+        callback: optional function - see stats
+    OUTPUT:
+        stats - filled in as the block runs, recordings can be nested and each one sees every event
+    '''
+    recorder = stats(callback)
+    _active.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _active.remove(recorder)
+
+
+# Whether any recording is active
+def enabled():
+    return bool(_active)
+
+
+# Times a phase of the calculation, costs one check when nothing is recording
+def phase(name):
+    if not _active:
+        return _no_phase
+    return timed_phase(name)
+
+
+@contextmanager
+def timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        for recorder in _active:
+            recorder.add_phase(name, seconds)
+
+
+# Increments a counter on every active recording
+def count(name, n=1):
+    for recorder in _active:
+        recorder.add_count(name, n)
+
+
+# Notes a value such as a matrix size on every active recording
+def note(name, value):
+    for recorder in _active:
+        recorder.add_note(name, value)
+
+
+
+
+
+# Test Function
+if __name__ == '__main__':
+    # Import by module name so the recording is the one the calculator reports to, not a copy under __main__
+    from Instrumentation import recording
+    from Beam_Calculator import sing_calc, sing
+
+    bc = [{'loc': float(i), 'type': 'p'} for i in range(21)]
+    events = []
+    with recording(callback=lambda kind, name, value: events.append(kind)) as recorded:
+        calc = sing_calc(l=20, I=1000, E=10, bc=bc, loading=[sing(coeff=-1, a=0, pow=0)], print_results=False)
+        calc.extrema('moment')
+    print(recorded)
+    print(f'Events seen by the callback: {len(events)}')
@@ -0,0 +1,172 @@
+# Applies factored load combinations to one beam by superposing cached responses to each named load case
+import copy
+import numpy as np
+from collections import OrderedDict
+from Beam_Calculator import sing_calc
+from Singularity_function import Singularity_function as sing
+from Singularity_equation import Singularity_equation as sing_eq
+
+'''
+INPUT:
+    l, I, E, bc
+        same as sing_calc
+    max_cached
+        int
+        most load case responses to keep in memory, least recently used are evicted and re-solved if needed again
+    verbose
+        bool
+        whether to dump cache activity to the console
+'''
+
+
+class load_combinations():
+
+
+    def __init__(self, max_cached=64, verbose=False, **kwargs):
+        # Solve an unloaded beam once, every case reuses its factorized support system
+        self.beam = sing_calc(loading=[], print_results=False, verbose=verbose, **kwargs)
+        self.max_cached = max_cached
+        self.verbose = verbose
+
+        # Case definitions are kept, solved responses are cached
+        self.cases = OrderedDict()
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    # Define a named load case such as D (dead), L (live), or S (snow)
+    def add_case(self, name, loading):
+        '''
+        INPUT:
+            name: string - name of the load case
+            loading: sing_eq or iterable of Singularity_function objects - loading of the case alone
+        '''
+        self.cases[name] = self.beam.check_loading(loading)
+        self.cache.pop(name, None)
+
+
+    # Remove a named load case and its cached response
+    def remove_case(self, name):
+        try:
+            del self.cases[name]
+        except KeyError:
+            raise AttributeError(f'LOAD CASE {name} NOT FOUND')
+        self.cache.pop(name, None)
+
+
+    # Returns the cached responses of the named cases, solving every missing case together in one batch
+    def responses(self, names):
+        '''
+        INPUT:
+            names: iterable of strings - load case names
+        OUTPUT:
+            list of dicts, one per name, with fields
+                sols: 1D numpy array - solved unknowns of the support equations
+                terms: list of (a, pow, eval_all_a) - terms of the E*I*deflection equation
+                coeffs: 1D numpy array - coefficient of each term
+        '''
+        names = list(names)
+        for name in names:
+            if name not in self.cases:
+                raise AttributeError(f'LOAD CASE {name} NOT FOUND')
+
+        # Solve misses as columns of one right hand side
+        missing = [name for name in dict.fromkeys(names) if name not in self.cache]
+        self.misses += len(missing)
+        self.hits += len(names) - len(missing)
+        if missing:
+            self.vprint(f'Solving load cases: {missing}')
+            for name, case in zip(missing, self.beam.solve_load_cases([self.cases[i] for i in missing])):
+                deflection = case.deflection_equation()
+                self.cache[name] = {
+                    'sols': case.sols,
+                    'terms': [(i.a, i.pow, i.eval_all_a) for i in deflection.sings],
+                    'coeffs': np.array([i.coeff for i in deflection.sings], dtype=float),
+                    }
+
+        # Mark as recently used, then evict the least recently used beyond the limit
+        responses = []
+        for name in names:
+            self.cache.move_to_end(name)
+            responses.append(self.cache[name])
+        while len(self.cache) > max(self.max_cached, len(set(names))):
+            evicted, _ = self.cache.popitem(last=False)
+            self.vprint(f'Evicting load case: {evicted}')
+        return responses
+
+
+    # Reactions of a load combination, a weighted sum of the cached solutions
+    def reactions(self, factors):
+        '''
+        INPUT:
+            factors: dict - load factor of each case name, ex: {'D': 1.2, 'L': 1.6, 'S': 0.5}
+        OUTPUT:
+            dict - reaction force/moment and integration constant by label
+        '''
+        names = list(factors.keys())
+        weights = np.array([factors[name] for name in names], dtype=float)
+        sols = weights @ np.array([i['sols'] for i in self.responses(names)])
+        return dict(zip(self.beam.support_system().labels, sols))
+
+
+    # Solved beam for a load combination, no further solves are needed once each case is cached
+    def combine(self, factors, print_results=False):
+        '''
+        INPUT:
+            factors: dict - load factor of each case name, ex: {'D': 1.2, 'L': 1.6, 'S': 0.5}
+            print_results: bool - Whether to dump the combined solution to the console
+        OUTPUT:
+            sing_calc - solved calculator for the combined loading, with reactions and profiles
+        '''
+        names = list(factors.keys())
+        weights = np.array([factors[name] for name in names], dtype=float)
+        responses = self.responses(names)
+
+        # Line up every case's deflection terms, then the combination is one dot product per quantity
+        terms = list(dict.fromkeys(term for i in responses for term in i['terms']))
+        index = {term: j for j, term in enumerate(terms)}
+        coeffs = np.zeros([len(names), len(terms)])
+        for k, response in enumerate(responses):
+            coeffs[k, [index[term] for term in response['terms']]] = response['coeffs']
+        deflection_coeffs = weights @ coeffs
+        sols = weights @ np.array([i['sols'] for i in responses])
+
+        # Package as a solved calculator sharing the beam's supports
+        loading = sing_eq([])
+        for name, weight in zip(names, weights):
+            loading = loading + (self.cases[name].copy() * float(weight))
+        combined = copy.copy(self.beam)
+        combined.loading = loading
+        combined.set_solution(sols)
+        combined.deflection_sing_eq = sing_eq([sing(coeff=c, a=a, pow=pow, eval_all_a=eval_all_a) for (a, pow, eval_all_a), c in zip(terms, deflection_coeffs)])
+        if print_results:
+            combined.print_results()
+        return combined
+
+
+    # Debug print statement, only prints when verbose set to true
+    def vprint(self, string):
+        if self.verbose:
+            print(string)
+
+
+
+
+
+# Test Function
+if __name__ == '__main__':
+    bc = [
+            {'loc':0, 'type': 'f'}
+            ,{'loc':0.5, 'type': 'p'}
+            ,{'loc':1.5, 'type': 'p'}
+            ,{'loc':2, 'type': 'p'}
+         ]
+    combos = load_combinations(l=3, I=1000, E=10, bc=bc)
+    combos.add_case('D', [sing(coeff=-1, a=0, pow=0)])
+    combos.add_case('L', [sing(coeff=-2, a=1, pow=-1)])
+    combos.add_case('S', [sing(coeff=-0.5, a=2.5, pow=-1)])
+
+    combined = combos.combine({'D': 1.2, 'L': 1.6, 'S': 0.5}, print_results=True)
+    print(f'Max moment: {combined.extrema("moment")}')
+    print(f'Cache hits: {combos.hits}, misses: {combos.misses}')
@@ -0,0 +1,177 @@
+# Propagates uncertain E, I, loads, and support locations through a beam, solving every sample that shares a support layout as one batch
+import numpy as np
+from Beam_Calculator import sing_calc, support_system, sparse_support_system, INTEGRALS
+from Singularity_function import integrate_terms
+
+'''
+Every input can be a single value or an array with one value per sample, arrays must all have the same number of samples
+Loading terms can be Singularity_function objects or dicts with coeff, a, pow, and optionally eval_all_a, where coeff and a may be arrays
+Support locations (bc loc) may be arrays, samples with identical support locations are solved together
+E, I, and load values do not change the support equations, so they never split a batch
+'''
+
+
+# Runs the Monte Carlo analysis and returns distributions of the profiles and reactions
+def monte_carlo(l, E, I, bc, loading, x=None, profiles=('deflection', 'moment'), percentiles=(5, 50, 95), bins=50, solver='dense', max_values=2**22):
+    '''
+    INPUT:
+        l: numerical - length of beam
+        E: numerical or 1D array - Young's Modulous of each sample
+        I: numerical or 1D array - 2nd moment of area of each sample, ex: sing_calc.I(shape='circle', dims=diameters)
+        bc: iterable of dictionaries with loc (numerical or 1D array) and type (f/p)
+        loading: iterable of Singularity_function objects or dicts - coeff and a may be 1D arrays
+        x: optional 1D numpy array - points to build the envelopes on, defaults to 1000 points along the beam
+        profiles: iterable of strings - profiles to build envelopes and peaks of
+        percentiles: iterable of numbers - percentiles of the envelopes, 0 to 100
+        bins: int - number of bins of each reaction histogram
+        solver: string - dense or sparse, see sing_calc
+        max_values: int - most sample x point values held in memory at once, x is processed in chunks to stay under it
+    OUTPUT:
+        dict with fields
+            samples: int - number of samples
+            x: 1D numpy array - points of the envelopes
+            percentiles: 1D numpy array
+            envelopes: dict by profile of 2D numpy arrays (percentiles x points)
+            mean: dict by profile of 1D numpy arrays - mean of each point over the samples
+            peaks: dict by profile of 1D numpy arrays - signed value of largest magnitude along x of each sample
+            labels: list of strings - names of the reactions, columns of reactions
+            reactions: 2D numpy array (samples x reactions)
+            histograms: dict by label of (counts, bin edges)
+            layouts: int - number of distinct support layouts, each solved as one batch
+    '''
+    for name in profiles:
+        if name not in INTEGRALS:
+            raise AttributeError('INVALID PROFILE NAME, VALID NAMES ARE: \n\tshear\n\tmoment\n\tslope\n\tdeflection')
+    if solver not in ('dense', 'sparse'):
+        raise AttributeError(f'INVALID SOLVER {solver}, VALID SOLVERS ARE: \n\tdense\n\tsparse')
+    if x is None:
+        x = np.linspace(0, l, 1000)
+    x = np.asarray(x, dtype=float).reshape(-1)
+    percentiles = np.asarray(percentiles, dtype=float)
+
+    # Broadcast every input to one value per sample
+    bc = [dict(supp) for supp in bc]
+    loading = [load if isinstance(load, dict) else {'coeff': load.coeff, 'a': load.a, 'pow': load.pow, 'eval_all_a': load.eval_all_a} for load in loading]
+    inputs = [E, I] + [supp['loc'] for supp in bc] + [load['coeff'] for load in loading] + [load['a'] for load in loading]
+    n_samples = max([np.size(i) for i in inputs])
+    def per_sample(value):
+        return np.broadcast_to(np.asarray(value, dtype=float).reshape(-1), (n_samples,))
+    EI = per_sample(E) * per_sample(I)
+    locs = np.stack([per_sample(supp['loc']) for supp in bc], axis=1) if bc else np.zeros([n_samples, 0])
+    load_coeff = [per_sample(load['coeff']) for load in loading]
+    load_a = [per_sample(load['a']) for load in loading]
+    load_pow = [int(load['pow']) for load in loading]
+    load_eval_all_a = [bool(load.get('eval_all_a', False)) for load in loading]
+
+    # Standardize support types like sing_calc
+    for supp in bc:
+        if str(supp['type']).lower()[0] not in ('p', 'f'):
+            raise AttributeError(f'INVALID FORMAT FOR SUPPORT {supp}\nSupport type must be either p/pinned or f/fixed')
+        supp['type'] = str(supp['type']).lower()[0]
+
+    # Solve each support layout once for all of its samples, reactions do not depend on E*I so the system uses E*I = 1
+    layouts, layout_of = np.unique(locs, axis=0, return_inverse=True)
+    layout_of = layout_of.reshape(-1)
+    system_type = sparse_support_system if solver == 'sparse' else support_system
+    groups = []
+    sols = None
+    for k, layout in enumerate(layouts):
+        samples = np.flatnonzero(layout_of == k)
+        system = system_type([{'loc': float(loc), 'type': supp['type']} for loc, supp in zip(layout, bc)], l, 1, 1)
+        B = np.zeros([system.A.shape[0], samples.size])
+        for coeff, a, pow, eval_all_a in zip(load_coeff, load_a, load_pow, load_eval_all_a):
+            B += system.rhs_terms(coeff[samples], a[samples], np.full(samples.size, pow), np.full(samples.size, eval_all_a))
+        group_sols = system.solve(B)
+        if sols is None:
+            sols = np.zeros([n_samples, group_sols.shape[0]])
+        sols[samples] = group_sols.T
+        groups.append((samples, system))
+    labels = list(groups[0][1].labels)
+
+    results = {
+        'samples': n_samples,
+        'x': x,
+        'percentiles': percentiles,
+        'envelopes': {name: np.zeros([percentiles.size, x.size]) for name in profiles},
+        'mean': {name: np.zeros(x.size) for name in profiles},
+        'peaks': {name: np.zeros(n_samples) for name in profiles},
+        'labels': labels,
+        'reactions': sols,
+        'histograms': {label: np.histogram(sols[:, j], bins=bins) for j, label in enumerate(labels)},
+        'layouts': len(layouts),
+        }
+
+    # Profiles over chunks of x so samples x points stays under max_values
+    chunk = max(1, max_values // max(n_samples, 1))
+    for start in range(0, x.size, chunk):
+        x_chunk = x[start:start + chunk]
+        for name in profiles:
+            values = profile_values(name, x_chunk, groups, sols, EI, load_coeff, load_a, load_pow, load_eval_all_a)
+            # Percentiles along contiguous rows, partitioning down columns is several times slower
+            results['envelopes'][name][:, start:start + x_chunk.size] = np.percentile(np.ascontiguousarray(values.T), percentiles, axis=1)
+            results['mean'][name][start:start + x_chunk.size] = values.mean(axis=0)
+
+            # Keep the largest magnitude seen so far for each sample
+            index = np.argmax(np.abs(values), axis=1)
+            chunk_peaks = values[np.arange(n_samples), index]
+            replace = np.abs(chunk_peaks) > np.abs(results['peaks'][name])
+            results['peaks'][name][replace] = chunk_peaks[replace]
+
+    return results
+
+
+# Returns one profile of every sample on x, (samples x points)
+def profile_values(name, x, groups, sols, EI, load_coeff, load_a, load_pow, load_eval_all_a):
+    n = INTEGRALS[name]
+    values = np.zeros([sols.shape[0], x.size])
+
+    # Support terms of each layout times that layout's solutions
+    for samples, system in groups:
+        values[samples] = sols[samples] @ system.term_matrix(x, *system.packed_terms(n), limit=False)
+
+    # Each load term is evaluated once per distinct location with a unit coefficient, then scaled by every sample's coefficient
+    for coeff, a, pow, eval_all_a in zip(load_coeff, load_a, load_pow, load_eval_all_a):
+        unit_coeff, unit_pow = integrate_terms([1.0], [pow], n)
+        locations, location_of = np.unique(a, return_inverse=True)
+        unit_values = support_system.term_matrix(x, np.full(locations.size, unit_coeff[0]), locations, np.full(locations.size, unit_pow[0]), np.full(locations.size, eval_all_a))
+        scaled = unit_values[location_of.reshape(-1)]
+        scaled *= coeff[:, np.newaxis]
+        values += scaled
+
+    # Slope and deflection are E*I times too large
+    if n > 2:
+        values /= EI[:, np.newaxis]
+    return values
+
+
+
+
+
+# Test Function
+if __name__ == '__main__':
+    import time
+
+    # Shaft from Run_Beam_Calc.py with a diameter tolerance, material scatter, uncertain loads, and a bearing in one of two seats
+    rng = np.random.default_rng(0)
+    n = 100000
+    l1, l2, l3 = 0.02375, 0.0314, 0.028
+    l = l1+l2+l3
+    d = rng.normal(0.03, 0.0001, n)
+    bc = [
+        {'loc': l1+l2+l3, 'type': 'p'},
+        {'loc': rng.choice([l1, l1 + 0.001], n), 'type': 'p'},
+        {'loc': 0, 'type': 'f'},
+        {'loc': l2, 'type': 'p'},
+        ]
+    loading = [
+        {'coeff': rng.normal(3396.24, 100, n), 'a': l1+l2, 'pow': -1}, # Force
+        {'coeff': rng.normal(274, 10, n), 'a': l1+l2, 'pow': -2}, # Moment
+        ]
+
+    start = time.perf_counter()
+    results = monte_carlo(l, E=rng.normal(71.7*10**9, 10**9, n), I=sing_calc.I(shape='circle', dims=d), bc=bc, loading=loading)
+    print(f'{n} samples in {results["layouts"]} layouts: {time.perf_counter() - start:.3f}s')
+    for name in results['envelopes']:
+        print(f'{name} peak percentiles {results["percentiles"]}: {np.percentile(results["peaks"][name], results["percentiles"])}')
+    counts, edges = results['histograms']['Fr0']
+    print(f'Fr0 from {edges[0]:.1f} to {edges[-1]:.1f}, most common bin holds {counts.max()} samples')
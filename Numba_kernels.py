@@ -0,0 +1,48 @@
+# Compiled kernels for evaluating singularity functions, used instead of the numpy code when numba is installed
+# Each kernel does the a condition, power, and sum for a point in one pass with no temporary arrays, and runs without the GIL
+# Kernels are serial so they stay safe in threads and forked process pools, run them from several threads or processes to use more cores
+# Powers are repeated multiplication and sums run in term order, the same steps as the numpy code, so results round identically
+from numba import njit
+
+
+# Sum of every term at each point, see Singularity_equation.value
+@njit(nogil=True, cache=True)
+def equation_values(x, coeff, a, pow, eval_all_a, negative, out):
+    '''
+    INPUT:
+        x: 1D float array - points to evaluate at
+        coeff, a, pow, eval_all_a: 1D arrays (float, float, int, bool) - parameters of each term, all powers must be positive or zero
+        negative: bool - whether to take the limit from the left when x = a
+        out: 1D float array, same size as x - filled with the sum of the terms at each point
+    '''
+    for j in range(x.size):
+        total = 0.0
+        for i in range(coeff.size):
+            if not eval_all_a[i] and (x[j] < a[i] or (negative and x[j] == a[i])):
+                continue
+            base = x[j] - a[i]
+            value = 1.0
+            for k in range(pow[i]):
+                value *= base
+            total += coeff[i] * value
+        out[j] = total
+
+
+# Value of each term at each point, see Singularity_function.term_values
+@njit(nogil=True, cache=True)
+def term_values(x, coeff, a, pow, eval_all_a, negative, out):
+    '''
+    INPUT:
+        x, coeff, a, pow, eval_all_a, negative: see equation_values
+        out: 2D float array (terms x points) - filled with each term's value
+    '''
+    for i in range(coeff.size):
+        for j in range(x.size):
+            if not eval_all_a[i] and (x[j] < a[i] or (negative and x[j] == a[i])):
+                out[i, j] = 0.0
+                continue
+            base = x[j] - a[i]
+            value = 1.0
+            for k in range(pow[i]):
+                value *= base
+            out[i, j] = coeff[i] * value
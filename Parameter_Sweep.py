@@ -0,0 +1,140 @@
+# Solves a beam over grids of design parameters, spreading chunks of the grid across a process pool
+import os
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Beam_Calculator import sing_calc, sing
+
+'''
+A sweep needs a model function that builds a beam from one set of parameters:
+    model(**params) -> dict of sing_calc arguments (l, I, E, bc, loading)
+The model must be defined at module level so worker processes can import it
+'''
+
+
+# Solves the model at every combination of the parameter grids
+def sweep(model, grids, profiles=('moment', 'deflection'), processes=None, chunksize=None):
+    '''
+    INPUT:
+        model: function - takes parameters as keyword arguments and returns sing_calc arguments
+        grids: dict - iterable of values for each parameter name, every combination is solved
+        profiles: iterable of strings - profiles to find the peak magnitude and location of
+        processes: optional int - number of worker processes, defaults to the number of cpus, 1 runs in this process
+        chunksize: optional int - number of grid points per task, defaults to about 4 tasks per process
+    OUTPUT:
+        structured numpy array with one record per grid point, in the order of itertools.product over grids
+            <parameter name>: float - value of each parameter
+            reactions: float array - solved reactions, ordered like sing_calc.support_system().labels
+            max_abs_<profile>: float - signed value of the profile with the largest magnitude
+            x_max_abs_<profile>: float - location of that value
+    '''
+    names = list(grids.keys())
+    points = np.array(list(itertools.product(*[list(grids[name]) for name in names])), dtype=float).reshape(-1, len(names))
+
+    # Split the grid into contiguous chunks
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, -(-len(points) // (4 * processes)))
+    chunks = [points[i:i + chunksize] for i in range(0, len(points), chunksize)]
+    tasks = [(model, names, chunk, tuple(profiles)) for chunk in chunks]
+
+    # Workers return chunks in order, so results match a serial run
+    if processes == 1:
+        results = [solve_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(solve_chunk, *zip(*tasks)))
+
+    # Check every grid point has the same supports
+    n_reactions = {i['reactions'].shape[1] for i in results}
+    if len(n_reactions) > 1:
+        raise Exception('ALL GRID POINTS OF A SWEEP MUST HAVE THE SAME NUMBER OF REACTIONS')
+    n_reactions = n_reactions.pop() if n_reactions else 0
+
+    # Package as a structured array
+    dtype = [(name, float) for name in names] + [('reactions', float, (n_reactions,))]
+    for profile in profiles:
+        dtype += [(f'max_abs_{profile}', float), (f'x_max_abs_{profile}', float)]
+    output = np.zeros(len(points), dtype=dtype)
+    for j, name in enumerate(names):
+        output[name] = points[:, j]
+    for field in output.dtype.names[len(names):]:
+        output[field] = np.concatenate([i[field] for i in results]) if results else []
+    return output
+
+
+# Solves one chunk of grid points, used by each worker
+def solve_chunk(model, names, points, profiles):
+    '''
+    INPUT:
+        model: function - see sweep
+        names: list of strings - parameter names, columns of points
+        points: 2D numpy array (grid points x parameters)
+        profiles: tuple of strings - profiles to find the peak of
+    OUTPUT:
+        dict of numpy arrays with one row per grid point, fields match sweep's output
+    '''
+    reactions = []
+    results = {}
+    for profile in profiles:
+        results[f'max_abs_{profile}'] = np.zeros(len(points))
+        results[f'x_max_abs_{profile}'] = np.zeros(len(points))
+
+    for i, point in enumerate(points):
+        params = dict(zip(names, point.tolist()))
+        calc = sing_calc(print_results=False, **model(**params))
+        reactions.append(list(calc.reactions.values()))
+        for profile in profiles:
+            extrema = calc.extrema(profile)
+            results[f'max_abs_{profile}'][i] = extrema['max_abs']
+            results[f'x_max_abs_{profile}'][i] = extrema['x_max_abs']
+
+    results['reactions'] = np.array(reactions, dtype=float).reshape(len(points), -1)
+    return results
+
+
+# Shaft from Run_Beam_Calc.py with spans, diameter, and material as parameters
+def shaft_model(l1=0.02375, l2=0.0314, l3=0.028, d=0.03, E=71.7*10**9):
+    l = l1+l2+l3
+    return {
+        'l': l,
+        'E': E,
+        'I': sing_calc.I(shape='circle', dims=d),
+        'loading': [
+            sing(coeff=3396.24, a=l1+l2, pow=-1), # Force
+            sing(coeff=274, a=l1+l2, pow=-2), # Moment
+            ],
+        'bc': [
+            {'loc':l1+l2+l3, 'type': 'p'}
+            ,{'loc':l1, 'type': 'p'}
+            ,{'loc':0, 'type': 'f'}
+            ,{'loc':l2, 'type': 'p'}
+            ],
+        }
+
+
+
+
+
+# Test Function
+if __name__ == '__main__':
+    import time
+
+    grids = {
+        'd': np.linspace(0.02, 0.04, 20),
+        'E': [71.7*10**9, 200*10**9],
+        'l3': np.linspace(0.02, 0.04, 10),
+        }
+
+    start = time.perf_counter()
+    serial = sweep(shaft_model, grids, processes=1)
+    print(f'Serial: {time.perf_counter() - start:.3f}s for {len(serial)} beams')
+
+    start = time.perf_counter()
+    parallel = sweep(shaft_model, grids)
+    print(f'Parallel: {time.perf_counter() - start:.3f}s for {len(parallel)} beams')
+
+    print(f'Same results: {all(np.array_equal(serial[i], parallel[i]) for i in serial.dtype.names)}')
+    stiffest = parallel[np.argmin(np.abs(parallel["max_abs_deflection"]))]
+    print(f'Smallest peak deflection: {stiffest}')
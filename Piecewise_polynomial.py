@@ -0,0 +1,219 @@
+# Stores a singularity equation as an ordinary polynomial on each segment between its breakpoints
+import numpy as np
+from math import comb
+
+'''
+INPUT:
+    breakpoints
+        sorted 1D numpy array
+        x values where the polynomial changes (the a values of the singularity functions)
+    origins
+        1D numpy array, one more entry than breakpoints
+        x value each segment's polynomial is expanded about
+    coeffs
+        2D numpy array (segments x degree+1)
+        polynomial coefficients of each segment in powers of (x - origin), lowest power first
+Segment 0 covers x < breakpoints[0], segment k covers breakpoints[k-1] <= x < breakpoints[k]
+'''
+
+
+class Piecewise_polynomial:
+
+
+    # Store segment info
+    def __init__(self, breakpoints, origins, coeffs):
+        self.breakpoints = np.asarray(breakpoints, dtype=float)
+        self.origins = np.asarray(origins, dtype=float)
+        self.coeffs = np.atleast_2d(np.asarray(coeffs, dtype=float))
+
+        # Sanitize input
+        if not (self.origins.size == self.breakpoints.size + 1 == self.coeffs.shape[0]):
+            raise Exception('PIECEWISE POLYNOMIAL NEEDS ONE ORIGIN AND ONE ROW OF COEFFICIENTS PER SEGMENT')
+
+
+    # Build from the packed term arrays of a compiled singularity equation
+    @staticmethod
+    def from_terms(coeff, a, pow, eval_all_a):
+        '''
+        INPUT:
+            coeff, a, pow, eval_all_a: 1D numpy arrays - parameters of each term, all powers must be positive or zero
+        OUTPUT:
+            Piecewise_polynomial equal to the sum of the terms
+        '''
+        coeff = np.asarray(coeff, dtype=float)
+        a = np.asarray(a, dtype=float)
+        pow = np.asarray(pow, dtype=int)
+        eval_all_a = np.asarray(eval_all_a, dtype=bool)
+
+        # Terms only switch on at their a value, eval_all_a terms are on everywhere
+        breakpoints = np.unique(a[~eval_all_a])
+        if breakpoints.size:
+            origins = np.concatenate([breakpoints[:1], breakpoints])
+        else:
+            origins = np.zeros(1)
+
+        # Each term switches on in the segment that starts at its a, eval_all_a terms in segment 0
+        first_segment = np.searchsorted(breakpoints, a) + 1
+        first_segment[eval_all_a] = 0
+
+        # Binomial expansion of c(x - a)^p about the origin of that segment: c * comb(p, j) * (origin - a)^(p - j) * (x - origin)^j
+        degree = int(pow.max(initial=0))
+        binomials = np.array([[comb(p, j) for j in range(degree + 1)] for p in range(degree + 1)], dtype=float)
+        shift = origins[first_segment] - a
+        added = np.zeros([origins.size, degree + 1])
+        for j in range(degree + 1):
+            has_power = pow >= j
+            contribution = coeff * binomials[np.where(has_power, pow, 0), j] * shift ** np.where(has_power, pow - j, 0)
+            np.add.at(added[:, j], first_segment, contribution * has_power)
+
+        # Carry each segment's polynomial to the next origin, (x - o)^j = sum of comb(j, i) h^(j - i) (x - o - h)^i, then add the terms that switch on there
+        exponents = np.maximum(np.subtract.outer(np.arange(degree + 1), np.arange(degree + 1)), 0)
+        coeffs = added
+        for k in range(1, origins.size):
+            coeffs[k] += coeffs[k - 1] @ (binomials * (origins[k] - origins[k - 1]) ** exponents)
+
+        return Piecewise_polynomial(breakpoints, origins, coeffs)
+
+
+    # Returns the value of the polynomial, locates each x's segment by binary search then applies Horner's method
+    def value(self, x, direction='positive'):
+        # Direction - Evaluate limit from negative or positive direction, changes behavior when x is a breakpoint
+        x_np = np.asarray(x, dtype=float)
+        segment = self.segment(x_np, direction)
+        t = x_np - self.origins[segment]
+
+        # Horner's method from the highest power down
+        value = self.coeffs[segment, -1]
+        for j in range(self.coeffs.shape[1] - 2, -1, -1):
+            value = value * t + self.coeffs[segment, j]
+
+        # Single x values return a number
+        if x_np.ndim == 0:
+            return float(value)
+        return value
+
+
+    # Returns the index of the segment each x is in
+    def segment(self, x, direction='positive'):
+        # Positive direction takes the segment to the right of a breakpoint, negative takes the one to the left
+        if direction[0].lower() == 'n':
+            side = 'left'
+        else:
+            side = 'right'
+        return np.searchsorted(self.breakpoints, x, side=side)
+
+
+    # Returns the derivative as a new piecewise polynomial with the same breakpoints
+    def derivative(self):
+        degree = self.coeffs.shape[1] - 1
+        if degree == 0:
+            return Piecewise_polynomial(self.breakpoints, self.origins, np.zeros_like(self.coeffs))
+        return Piecewise_polynomial(self.breakpoints, self.origins, self.coeffs[:, 1:] * np.arange(1, degree + 1))
+
+
+    # Returns the sorted x values in [lo, hi] where the polynomial crosses or touches zero
+    def zeros(self, lo, hi):
+        '''
+        INPUT:
+            lo, hi: numerical - interval to search
+        OUTPUT:
+            1D numpy array - roots of each segment, and breakpoints where the value jumps across zero or is zero on either side
+        '''
+        found = [self.segment_roots(k, lo, hi) for k in self.segments_in(lo, hi)]
+
+        # Breakpoints count when the value jumps across zero or either side is zero up to roundoff, the interval ends when their inside is
+        inside = self.breakpoints[(self.breakpoints > lo) & (self.breakpoints < hi)]
+        left = self.value(inside, direction='negative')
+        right = self.value(inside, direction='positive')
+        ends = np.array([self.value(lo, direction='positive'), self.value(hi, direction='negative')])
+        small = 1e-9 * np.max(np.abs(np.concatenate([left, right, ends])))
+        found.append(inside[(left * right < 0) | (np.abs(left) <= small) | (np.abs(right) <= small)])
+        found.append(np.array([lo, hi])[np.abs(ends) <= small])
+
+        # Neighbouring segments both find a root on their shared breakpoint, keep one of each cluster
+        x = np.sort(np.concatenate(found))
+        return x[np.diff(x, prepend=-np.inf) > self.tolerance(lo, hi)]
+
+
+    # Returns the exact max, min, and largest magnitude values on [lo, hi] and their locations
+    def extrema(self, lo, hi):
+        '''
+        INPUT:
+            lo, hi: numerical - interval to search
+        OUTPUT:
+            dict with fields
+                max, x_max: largest value and its location
+                min, x_min: smallest value and its location
+                max_abs, x_max_abs: value with the largest magnitude (signed) and its location
+        '''
+        # Candidates are the interval ends, both sides of each breakpoint, and the roots of the derivative
+        slope = self.derivative()
+        roots = np.concatenate([slope.segment_roots(k, lo, hi) for k in self.segments_in(lo, hi)] + [np.zeros(0)])
+        inside = self.breakpoints[(self.breakpoints > lo) & (self.breakpoints < hi)]
+        x = np.concatenate([[lo], inside, inside, roots, [hi]])
+        values = np.concatenate([
+            [self.value(lo, direction='positive')],
+            self.value(inside, direction='negative'),
+            self.value(inside, direction='positive'),
+            self.value(roots),
+            [self.value(hi, direction='negative')],
+            ])
+
+        i_max = np.argmax(values)
+        i_min = np.argmin(values)
+        i_abs = np.argmax(np.abs(values))
+        return {
+            'max': values[i_max], 'x_max': x[i_max],
+            'min': values[i_min], 'x_min': x[i_min],
+            'max_abs': values[i_abs], 'x_max_abs': x[i_abs],
+            }
+
+
+    # Returns the indices of the segments that overlap [lo, hi]
+    def segments_in(self, lo, hi):
+        return range(self.segment(lo), self.segment(hi, direction='negative') + 1)
+
+
+    # Returns the real roots of segment k that are inside both the segment and [lo, hi]
+    def segment_roots(self, k, lo, hi):
+        # Segment bounds clipped to the interval
+        start = max(lo, self.breakpoints[k-1]) if k > 0 else lo
+        end = min(hi, self.breakpoints[k]) if k < self.breakpoints.size else hi
+
+        # Highest power first for np.roots, skip segments that are identically zero or constant
+        poly = np.trim_zeros(self.coeffs[k][::-1], 'f')
+        if poly.size < 2:
+            return np.zeros(0)
+        t = np.roots(poly)
+        t = t[np.abs(t.imag) <= 1e-7 * np.maximum(1, np.abs(t.real))].real
+        x = t + self.origins[k]
+
+        # Roots on a breakpoint can land just off it from roundoff, snap them back onto it
+        tol = self.tolerance(lo, hi)
+        x = x[(x >= start - tol) & (x <= end + tol)]
+        x[np.abs(x - start) <= tol] = start
+        x[np.abs(x - end) <= tol] = end
+        return x
+
+
+    # Returns the distance below which two x values in [lo, hi] are treated as the same point
+    def tolerance(self, lo, hi):
+        # np.roots splits a double root (a fixed support's deflection) by about the square root of machine precision
+        return 1e-6 * max(hi - lo, abs(lo), abs(hi))
+
+
+    '''-----------------------------MAGIC METHODS-----------------------------'''
+
+
+    # return string representation of each segment
+    def __str__(self):
+        bounds = np.concatenate([[-np.inf], self.breakpoints, [np.inf]])
+        output = ''
+        for k in range(self.origins.size):
+            poly = ' + '.join(f'{c}(x - {self.origins[k]})^{j}' for j, c in enumerate(self.coeffs[k]))
+            output += f'[{bounds[k]}, {bounds[k+1]}): {poly}\n'
+        return output.strip('\n')
+
+
+    def __len__(self):
+        return self.origins.size
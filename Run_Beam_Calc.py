@@ -1,4 +1,5 @@
 from Beam_Calculator import *
+from matplotlib import pyplot as plot
 
 
 
@@ -1,8 +1,12 @@
 # Packages multuple singularity functions into one equation
 from Singularity_function import Singularity_function as sing
-from matplotlib import pyplot as plot
+from Singularity_function import term_values, jit_kernels, kernel_arrays
+from Piecewise_polynomial import Piecewise_polynomial
+from Instrumentation import phase, count
 import numpy as np
 import numbers
+import struct
+from bisect import bisect_left
 
 '''
 INPUT:
@@ -11,6 +15,43 @@ INPUT:
 '''
 
 
+# Yields blocks of the points of np.linspace(start, stop, num) without building the whole grid, each point is computed the same way so values match exactly
+def linspace_chunks(start, stop, num, chunk_size):
+    num = int(num)
+    if num < 0:
+        raise Exception('NUMBER OF POINTS MUST BE NON-NEGATIVE')
+    step = (float(stop) - float(start)) / (num - 1) if num > 1 else 0.0
+    for i in range(0, num, chunk_size):
+        x = np.arange(i, min(i + chunk_size, num), dtype=float)
+        x *= step
+        x += start
+        # np.linspace sets the last point to stop exactly
+        if num > 1 and i + chunk_size >= num:
+            x[-1] = stop
+        yield x
+
+
+# Returns zero copy views of the packed term arrays written by Singularity_equation.to_bytes, and the offset just past them
+def unpack_terms(buffer, offset=0):
+    '''
+    INPUT:
+        buffer: bytes like object
+        offset: int - position of the equation in buffer
+    OUTPUT:
+        dict of 1D numpy arrays viewing buffer: coeff, a, pow, eval_all_a
+        int - offset of the end of the equation
+    '''
+    magic, n = Singularity_equation.binary_header.unpack_from(buffer, offset)
+    if magic != Singularity_equation.binary_magic:
+        raise Exception('BUFFER DOES NOT HOLD A SINGULARITY EQUATION')
+    offset += Singularity_equation.binary_header.size
+    arrays = {}
+    for key, dtype in [('coeff', '<f8'), ('a', '<f8'), ('pow', '<i8'), ('eval_all_a', '?')]:
+        arrays[key] = np.frombuffer(buffer, dtype=dtype, count=n, offset=offset)
+        offset += arrays[key].nbytes
+    return arrays, offset + (-n % 8)
+
+
 class Singularity_equation:
 
 
@@ -25,11 +66,80 @@ class Singularity_equation:
             raise Exception('INVALID INPUT FOR SINGULARITY EQUATION')
         
         self.sings = list(sings)
-        self.sort_sings()
+        self.canonicalize()
+
+
+    # Max number of term x point values held in memory at once by value
+    chunk_size = 2**15
 
 
     # Return value of all singularity functions
     def value(self, x, direction='positive'):
+        count('Singularity_equation.value')
+
+        # Fall back to summing each term if coefficients cannot be packed into float arrays (ex: sym)
+        try:
+            compiled = self.compile()
+        except (TypeError, ValueError):
+            return self.value_terms(x, direction=direction)
+
+        # Flatten x and evaluate all terms together, in one compiled pass when numba is available, otherwise in chunks of points
+        x_np = np.asarray(x, dtype=float)
+        x_flat = x_np.reshape(-1)
+        value = np.zeros(x_flat.size)
+        kernels = jit_kernels()
+        if kernels is not None:
+            kernels.equation_values(*kernel_arrays(x_flat, compiled['coeff'], compiled['a'], compiled['pow'], compiled['eval_all_a']), direction[0].lower() == 'n', value)
+            count('term_evaluations', compiled['coeff'].size * x_flat.size)
+        elif compiled['coeff'].size:
+            chunk = max(1, self.chunk_size // compiled['coeff'].size)
+            for start in range(0, x_flat.size, chunk):
+                stop = start + chunk
+                value[start:stop] = term_values(x_flat[start:stop], compiled['coeff'], compiled['a'], compiled['pow'], compiled['eval_all_a'], direction).sum(axis=0)
+
+        # Single x values return a number, iterable x values keep the shape of x
+        if x_np.ndim == 0:
+            return value[0]
+        return value.reshape(x_np.shape)
+
+
+    # Points per block yielded by iter_values
+    stream_chunk = 2**20
+
+
+    # Yields the value over a grid like np.linspace one block at a time, so grids larger than memory can be processed
+    def iter_values(self, start, stop, num, chunk_size=None, direction='positive'):
+        '''
+        INPUT:
+            start, stop, num: numerical - grid of num evenly spaced points from start to stop inclusive, same points as np.linspace
+            chunk_size: optional int - points per block, defaults to stream_chunk
+            direction: string - limit direction used when x = a
+        OUTPUT:
+            generator of (x, values) 1D numpy arrays for each block in order
+        '''
+        for x in linspace_chunks(start, stop, num, chunk_size or self.stream_chunk):
+            yield x, self.value(x, direction=direction)
+
+
+    # Writes the value over a grid like np.linspace to a .npy file block by block, the file is memory mapped so the grid is never held in memory
+    def to_npy(self, path, start, stop, num, chunk_size=None, direction='positive'):
+        '''
+        INPUT:
+            path: string - .npy file to write, holds a structured array with fields x and value
+            start, stop, num, chunk_size, direction: see iter_values
+        '''
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=[('x', float), ('value', float)], shape=(int(num),))
+        i = 0
+        for x, values in self.iter_values(start, stop, num, chunk_size, direction):
+            out['x'][i:i + x.size] = x
+            out['value'][i:i + x.size] = values
+            i += x.size
+        out.flush()
+        del out
+
+
+    # Return value of all singularity functions by evaluating one at a time
+    def value_terms(self, x, direction='positive'):
         # Check if x is iterable
         iterable = True
         try:
@@ -40,9 +150,9 @@ class Singularity_equation:
         # Single x values
         if not iterable:
             value = 0.0
-        # Iterable x values
+        # Iterable x values, keep the shape of x
         else:
-            value = np.zeros(x.size)
+            value = np.zeros(np.shape(x))
         
         # Assign Values
         for sing in self.sings:
@@ -50,6 +160,63 @@ class Singularity_equation:
         return value
 
 
+    # Pack the singularity functions into contiguous arrays, rebuilt only when the terms change
+    def compile(self):
+        '''
+        OUTPUT:
+            dict of 1D numpy arrays with one entry per term that can be nonzero (power of 0 or more), ordered by power
+                coeff: float
+                a: float
+                pow: int
+                eval_all_a: bool
+        '''
+        key = self.terms_key()
+        if getattr(self, '_compiled_key', None) != key:
+            terms = sorted([i for i in self.sings if i.pow >= 0], key=lambda i: i.pow)
+            self._compiled = {
+                'coeff': np.array([float(np.squeeze(i.coeff)) for i in terms], dtype=float),
+                'a': np.array([float(i.a) for i in terms], dtype=float),
+                'pow': np.array([i.pow for i in terms], dtype=int),
+                'eval_all_a': np.array([i.eval_all_a for i in terms], dtype=bool),
+            }
+            self._compiled_key = key
+        return self._compiled
+
+
+    # Convert to a piecewise polynomial, point cost depends on the number of breakpoints instead of the number of terms
+    def to_piecewise(self):
+        '''
+        OUTPUT:
+            Piecewise_polynomial - same values as the equation, rebuilt only when the terms change
+        '''
+        compiled = self.compile()
+        if getattr(self, '_piecewise_key', None) != self._compiled_key:
+            self._piecewise = Piecewise_polynomial.from_terms(compiled['coeff'], compiled['a'], compiled['pow'], compiled['eval_all_a'])
+            self._piecewise_key = self._compiled_key
+        return self._piecewise
+
+
+    # Returns the exact extrema on [lo, hi] from the roots of the derivative of each piecewise polynomial segment
+    def extrema(self, lo, hi):
+        '''
+        INPUT:
+            lo, hi: numerical - interval to search
+        OUTPUT:
+            dict with fields max, x_max, min, x_min, max_abs, x_max_abs - see Piecewise_polynomial.extrema
+        '''
+        return self.to_piecewise().extrema(lo, hi)
+
+
+    # Returns the exact x values on [lo, hi] where the equation crosses zero
+    def zeros(self, lo, hi):
+        return self.to_piecewise().zeros(lo, hi)
+
+
+    # Returns the terms, used to detect when the compiled arrays are out of date. Terms are immutable so any edit replaces a term
+    def terms_key(self):
+        return tuple(self.sings)
+
+
     # Integrate all singularity functions
     def integrate(self, *args):
         # Check if passed number of iterations
@@ -57,11 +224,8 @@ class Singularity_equation:
             iterations = args[0]
         except:
             iterations = 1
-        # Integrate given number of times
-        for j in range(iterations):
-            # Integrate each singularity function
-            for i in range(len(self.sings)):
-                self.sings[i].integrate()
+        # Integrate each singularity function given number of times, terms are immutable so the list is replaced
+        self.sings = [i.integrate(iterations) for i in self.sings]
         return self
 
 
@@ -69,20 +233,27 @@ class Singularity_equation:
     def derivative(self, *args):
         # Check if passed number of iterations
         try:
-            iterations = args[1]
+            iterations = args[0]
         except:
             iterations = 1
-        # Integrate given number of times
+        # Take the derivitave of each singularity function given number of times
         for j in range(iterations):
-            # Integrate each singularity function
-            for i in range(len(self.sings)):
-                self.sings[i].derivitave()
+            self.sings = [i.derivitave() for i in self.sings]
 
 
-    # Add singularity function
+    # Add singularity function, merges with a like term if there is one
     def add_sing(self, sing:sing):
-        self.sings.append(sing)
-        self.sort_sings()
+        # Binary search for the sorted position, like terms share a sort key
+        key = self.sort_key(sing)
+        i = bisect_left(self.sings, key, key=self.sort_key)
+        if i < len(self.sings) and self.sort_key(self.sings[i]) == key:
+            merged = type(sing)(coeff=self.sings[i].coeff + sing.coeff, a=sing.a, pow=sing.pow, eval_all_a=sing.eval_all_a)
+            if merged.coeff == 0:
+                del self.sings[i]
+            else:
+                self.sings[i] = merged
+        elif not sing.coeff == 0:
+            self.sings.insert(i, sing)
 
 
     # Remove singularity function
@@ -95,7 +266,95 @@ class Singularity_equation:
 
     # Sort sings by a value
     def sort_sings(self):
-        self.sings = sorted(self.sings)
+        self.sings = sorted(self.sings, key=self.sort_key)
+
+
+    # Ordered by a, then highest power, like terms (same a, power, and eval_all_a) have the same key
+    @staticmethod
+    def sort_key(sing):
+        return (sing.a, -sing.pow, sing.eval_all_a)
+
+
+    # Relative size below which a coefficient is treated as zero, compared to the largest coefficient of the same power
+    zero_rtol = 1e-12
+
+
+    # Put the equation in canonical form: sorted, like terms merged, and zero or near zero coefficients dropped
+    def canonicalize(self, rtol=None):
+        '''
+        INPUT:
+            rtol: optional numerical - relative tolerance for near zero coefficients, defaults to zero_rtol
+        '''
+        if rtol is None:
+            rtol = self.zero_rtol
+
+        with phase('cleanup'):
+            # Merge runs of like terms after sorting
+            merged = []
+            for i in sorted(self.sings, key=self.sort_key):
+                if merged and self.sort_key(merged[-1]) == self.sort_key(i):
+                    merged[-1] = sing(coeff=merged[-1].coeff + i.coeff, a=i.a, pow=i.pow, eval_all_a=i.eval_all_a)
+                else:
+                    merged.append(i)
+
+            # Largest finite coefficient of each power sets the scale for near zero, skipped for non numeric coefficients (ex: sym)
+            # nan and inf coefficients are kept so bad input reaches the solver instead of vanishing
+            try:
+                sizes = [float(np.max(np.abs(i.coeff))) for i in merged]
+                scale = {}
+                for i, size in zip(merged, sizes):
+                    if np.isfinite(size):
+                        scale[i.pow] = max(scale.get(i.pow, 0.0), size)
+                self.sings = [i for i, size in zip(merged, sizes) if not np.isfinite(size) or size > rtol * scale[i.pow]]
+            except TypeError:
+                self.sings = [i for i in merged if not i.coeff == 0]
+        return self
+
+
+    # Binary layout: header of magic and number of terms, then packed coeff, a, pow, and eval_all_a arrays, padded to 8 bytes
+    binary_header = struct.Struct('<4s4xQ')
+    binary_magic = b'SGE1'
+
+
+    # Returns the equation as bytes that from_bytes reads back exactly, only numeric equations can be written
+    def to_bytes(self):
+        try:
+            coeff = np.array([float(np.squeeze(i.coeff)) for i in self.sings], dtype='<f8')
+            a = np.array([float(i.a) for i in self.sings], dtype='<f8')
+        except TypeError:
+            raise Exception('ONLY SINGULARITY EQUATIONS WITH NUMERIC COEFF AND A CAN BE WRITTEN TO BYTES')
+        pow = np.array([i.pow for i in self.sings], dtype='<i8')
+        eval_all_a = np.array([i.eval_all_a for i in self.sings], dtype='u1')
+        padding = bytes(-len(self.sings) % 8)
+        return b''.join([self.binary_header.pack(self.binary_magic, len(self.sings)), coeff.tobytes(), a.tobytes(), pow.tobytes(), eval_all_a.tobytes(), padding])
+
+
+    # Reads an equation written by to_bytes, starting at offset in any bytes like buffer
+    @staticmethod
+    def from_bytes(buffer, offset=0):
+        '''
+        INPUT:
+            buffer: bytes, bytearray, memoryview, or memory mapped file
+            offset: int - position of the equation in buffer
+        OUTPUT:
+            Singularity_equation - with its compiled arrays already filled in from the buffer
+        '''
+        return Singularity_equation.read_bytes(buffer, offset)[0]
+
+
+    # Reads an equation written by to_bytes and returns it with the offset just past it, for reading equations stored back to back
+    @staticmethod
+    def read_bytes(buffer, offset=0):
+        arrays, end = unpack_terms(buffer, offset)
+        equation = Singularity_equation([sing(coeff=c, a=a, pow=p, eval_all_a=e) for c, a, p, e in zip(arrays['coeff'].tolist(), arrays['a'].tolist(), arrays['pow'].tolist(), arrays['eval_all_a'].tolist())])
+
+        # Terms were written in canonical order, so the compiled arrays come straight from the buffer without packing the terms again
+        terms = np.flatnonzero(arrays['pow'] >= 0)
+        terms = terms[np.argsort(arrays['pow'][terms], kind='stable')]
+        if len(equation.sings) == arrays['coeff'].size:
+            equation._compiled = {key: np.ascontiguousarray(value[terms], dtype=dtype) for (key, value), dtype in zip(arrays.items(), [float, float, int, bool])}
+            equation._compiled_key = equation.terms_key()
+        return equation, end
 
 
     # Plot given a figure
@@ -109,7 +368,9 @@ class Singularity_equation:
         """
         y = self.value(x)
 
+        # matplotlib is only loaded when plotting so the numeric code imports without it
         if not fig:
+            from matplotlib import pyplot as plot
             fig = plot
         fig.plot(x, y, label=label)
 
@@ -117,23 +378,21 @@ class Singularity_equation:
     '''-----------------------------MAGIC METHODS-----------------------------'''
 
 
-    # Add elements to singularity equation
+    # Add elements to singularity equation, stays in canonical form
     def __add__(self, new):
         # Check type of object to add
         if hasattr(new, '__iter__'): # Iterable
             if type(new[0]) == sing: # of sings
                 self.sings += new
-                self.sort_sings()
             else:
                 raise Exception(f"CANNOT ADD {new} TO SING EQ OBJECT")
         elif isinstance(new, Singularity_equation): # Singularity Equation
-            for sing in new.sings:
-                self.add_sing(sing)
+            self.sings += new.sings
         elif isinstance(new, sing): # Single sing
-                self.add_sing(new)
+            self.sings.append(new)
         else:
             raise Exception(f"CANNOT ADD {new} TO SING EQ OBJECT")
-        return self
+        return self.canonicalize()
 
 
     # Add elements with negative - NOT IMPLEMENTED
@@ -160,8 +419,7 @@ class Singularity_equation:
     def __mul__(self, coeff):
         if not isinstance(coeff, numbers.Number):
             raise Exception(f'MUST MULTIPLY SINGULARITY FUNCTION BY A NUMBER')
-        for sing in self.sings:
-            sing.coeff *= coeff
+        self.sings = [i * coeff for i in self.sings]
         return self
 
 
@@ -169,18 +427,13 @@ class Singularity_equation:
     def __truediv__(self, coeff):
         if not isinstance(coeff, numbers.Number):
             raise Exception(f'MUST DIVIDE SINGULARITY FUNCTION BY A NUMBER')
-        for sing in self.sings:
-            sing.coeff /= coeff
+        self.sings = [i / coeff for i in self.sings]
         return self
 
     
-    # Return a copy of the singularity equation
+    # Return a copy of the singularity equation, terms are immutable so they are shared
     def copy(self):
-        temp_sings = []
-        for i in self.sings:
-            i_mod = i.copy()
-            temp_sings.append(i_mod)
-        return Singularity_equation(temp_sings)
+        return Singularity_equation(self.sings)
 
 
     # return string representation of the equation
@@ -210,6 +463,11 @@ class Singularity_equation:
 
 # Test equation functionality
 if __name__ == '__main__':
+    # Non finite coefficients are kept, and do not set the near zero scale of the other terms
+    nan_test = Singularity_equation([sing(coeff=np.nan, a=0, pow=-1), sing(coeff=2, a=2, pow=-1)])
+    inf_test = Singularity_equation([sing(coeff=np.inf, a=0, pow=-1), sing(coeff=2, a=2, pow=-1)])
+    print(f'NAN AND INF TERMS KEPT: {len(nan_test) == 2 and len(inf_test) == 2}')
+
     # Def sing. functions
     a = sing()
     b = sing(a = 10, pow = -1, coeff = -10)
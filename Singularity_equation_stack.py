@@ -0,0 +1,153 @@
+# Stacks the terms of many singularity equations so they are all evaluated on one x grid together
+import numpy as np
+from Singularity_function import term_values
+from Singularity_equation import Singularity_equation
+
+'''
+INPUT:
+    equations
+        Iterable of Singularity_equation objects, ex: the deflection profiles of many design variants
+Terms of every equation are stored ragged in flat arrays, ordered by power then equation, so no padding is evaluated
+'''
+
+
+class Singularity_equation_stack:
+
+
+    # Max number of term x point values held in memory at once
+    chunk_size = 2**20
+
+
+    # Pack the compiled terms of every equation into one set of flat arrays
+    def __init__(self, equations):
+        equations = list(equations)
+        for i in equations:
+            if not isinstance(i, Singularity_equation):
+                raise Exception('INVALID INPUT FOR SINGULARITY EQUATION STACK')
+        self.n_equations = len(equations)
+
+        compiled = [i.compile() for i in equations]
+        owner = np.concatenate([np.full(c['coeff'].size, k) for k, c in enumerate(compiled)] + [np.zeros(0, dtype=int)])
+        fields = {key: np.concatenate([c[key] for c in compiled] + [np.zeros(0, dtype=dtype)]) for key, dtype in [('coeff', float), ('a', float), ('pow', int), ('eval_all_a', bool)]}
+
+        # Order by power so term_values works in contiguous blocks, then by equation so each equation's terms of one power are adjacent
+        order = np.lexsort((owner, fields['pow']))
+        self.coeff = fields['coeff'][order]
+        self.a = fields['a'][order]
+        self.pow = fields['pow'][order]
+        self.eval_all_a = fields['eval_all_a'][order]
+        self.owner = owner[order]
+
+        # Runs of terms with the same power and equation are summed together, each run belongs to one equation
+        run_start = np.flatnonzero(np.diff(self.pow, prepend=-1) | np.diff(self.owner, prepend=-1)) if self.owner.size else np.zeros(0, dtype=int)
+        self.run_start = run_start
+        self.run_owner = self.owner[run_start]
+        self.run_pow = self.pow[run_start]
+
+
+    # Stack one profile of many solved beams
+    @staticmethod
+    def from_calcs(calcs, profile='deflection'):
+        '''
+        INPUT:
+            calcs: iterable of sing_calc - solved beams
+            profile: string - the name of the profile (shear, moment, slope, deflection)
+        OUTPUT:
+            Singularity_equation_stack - one equation per beam in the order given
+        '''
+        return Singularity_equation_stack([calc.get_profile(profile) for calc in calcs])
+
+
+    # Returns the value of every equation at every x
+    def value(self, x, direction='positive'):
+        '''
+        INPUT:
+            x: 1D iterable - points shared by every equation
+            direction: string - limit direction used when x = a
+        OUTPUT:
+            2D numpy array (equations x points)
+        '''
+        x = np.asarray(x, dtype=float).reshape(-1)
+        value = np.zeros([self.n_equations, x.size])
+        for start, stop in self.chunks(x.size):
+            value[:, start:stop] = self.chunk_value(x[start:stop], direction)
+        return value
+
+
+    # Returns the signed value of largest magnitude of each equation over x and where it is, without holding every value at once
+    def max_abs(self, x, direction='positive'):
+        '''
+        INPUT:
+            x: 1D iterable - points shared by every equation
+            direction: string - limit direction used when x = a
+        OUTPUT:
+            dict with fields
+                max_abs: 1D numpy array - one value per equation
+                x_max_abs: 1D numpy array - location of each value
+        '''
+        x = np.asarray(x, dtype=float).reshape(-1)
+        peak = np.zeros(self.n_equations)
+        x_peak = np.full(self.n_equations, x[0] if x.size else np.nan)
+        rows = np.arange(self.n_equations)
+        for start, stop in self.chunks(x.size):
+            value = self.chunk_value(x[start:stop], direction)
+            index = np.argmax(np.abs(value), axis=1)
+            chunk_peak = value[rows, index]
+            replace = np.abs(chunk_peak) > np.abs(peak)
+            peak[replace] = chunk_peak[replace]
+            x_peak[replace] = x[start + index[replace]]
+        return {'max_abs': peak, 'x_max_abs': x_peak}
+
+
+    # Yields (start, stop) of blocks of points that keep terms x points under chunk_size
+    def chunks(self, n_points):
+        chunk = max(1, self.chunk_size // max(self.coeff.size, 1))
+        for start in range(0, n_points, chunk):
+            yield start, min(start + chunk, n_points)
+
+
+    # Values of every equation at a block of points
+    def chunk_value(self, x, direction):
+        value = np.zeros([self.n_equations, x.size])
+        if self.coeff.size == 0:
+            return value
+
+        # Sum each run, then add runs into their equations one power at a time, within a power each equation has at most one run
+        runs = np.add.reduceat(term_values(x, self.coeff, self.a, self.pow, self.eval_all_a, direction), self.run_start, axis=0)
+        for pow in np.unique(self.run_pow):
+            block = self.run_pow == pow
+            value[self.run_owner[block]] += runs[block]
+        return value
+
+
+    def __len__(self):
+        return self.n_equations
+
+
+
+
+
+# Test Function
+if __name__ == '__main__':
+    import time
+    from Beam_Calculator import sing_calc, sing
+
+    # Variants of a two span beam with the middle support moved along it
+    calcs = []
+    for loc in np.linspace(0.5, 2.5, 1000):
+        calcs.append(sing_calc(l=3, I=1000, E=10, bc=[{'loc': 0, 'type': 'p'}, {'loc': loc, 'type': 'p'}, {'loc': 3, 'type': 'p'}], loading=[sing(coeff=-1, a=0, pow=0)], print_results=False))
+    x = np.linspace(0, 3, 2000)
+
+    start = time.perf_counter()
+    separate = np.array([calc.profiles['deflection'].value(x) for calc in calcs])
+    print(f'One at a time: {time.perf_counter() - start:.3f}s')
+
+    stack = Singularity_equation_stack.from_calcs(calcs, 'deflection')
+    start = time.perf_counter()
+    stacked = stack.value(x)
+    print(f'Stacked: {time.perf_counter() - start:.3f}s')
+    print(f'Largest difference: {np.max(np.abs(stacked - separate))}')
+
+    peaks = stack.max_abs(x)
+    best = np.argmin(np.abs(peaks['max_abs']))
+    print(f'Stiffest variant: middle support at {calcs[best].bc[1]["loc"]}, peak deflection {peaks["max_abs"][best]} at {peaks["x_max_abs"][best]}')
@@ -3,7 +3,11 @@
 ## This Class enables the logic of singularity function
 
 # from sympy import symbols as sym
+import os
+import struct
+import numbers
 import numpy as np
+from Instrumentation import count
 '''
 Arguments
     coeff
@@ -17,59 +21,184 @@ Arguments
         defined by type of loading/stress
 '''
 
+
+# Raises base to a whole number power by repeated multiplication so scalar and numpy array inputs round identically
+def int_pow(base, pow):
+    result = base ** 0
+    for i in range(int(pow)):
+        result = result * base
+    return result
+
+
+# Returns the compiled numba kernels, or None to evaluate with numpy. numba is optional and slow to import so it is loaded on first use
+# Set the environment variable SINGULARITY_BACKEND to numpy to never use numba, or call set_backend
+def jit_kernels():
+    global _jit_kernels
+    if _jit_kernels is False:
+        _jit_kernels = None
+        if os.environ.get('SINGULARITY_BACKEND', 'auto').lower() != 'numpy':
+            try:
+                import Numba_kernels as _jit_kernels
+            except ImportError: # evaluate with numpy instead
+                pass
+    return _jit_kernels
+
+
+_jit_kernels = False # Not loaded yet
+
+
+# Chooses how terms are evaluated: auto uses numba when it is installed, numba requires it, numpy never uses it
+def set_backend(name):
+    global _jit_kernels
+    if name == 'numpy':
+        _jit_kernels = None
+    elif name in ('auto', 'numba'):
+        _jit_kernels = False
+        if name == 'numba' and jit_kernels() is None:
+            raise Exception('NUMBA BACKEND REQUESTED BUT NUMBA IS NOT INSTALLED')
+    else:
+        raise Exception(f'INVALID BACKEND {name}, VALID BACKENDS ARE: \n\tauto\n\tnumba\n\tnumpy')
+
+
+# Packs term parameters into the contiguous arrays and types the compiled kernels take
+def kernel_arrays(x, coeff, a, pow, eval_all_a):
+    return (
+        np.ascontiguousarray(x, dtype=np.float64),
+        np.ascontiguousarray(coeff, dtype=np.float64),
+        np.ascontiguousarray(a, dtype=np.float64),
+        np.ascontiguousarray(pow, dtype=np.int64),
+        np.ascontiguousarray(eval_all_a, dtype=np.bool_),
+        )
+
+
+# Evaluates many singularity functions at once from their packed parameter arrays, used for compiled equations
+def term_values(x, coeff, a, pow, eval_all_a, direction='positive'):
+    '''
+    INPUT:
+        x: 1D numpy array - points to evaluate at
+        coeff, a, pow, eval_all_a: 1D numpy arrays - parameters of each term, all powers must be positive or zero
+        direction: string - limit direction used when x = a
+    OUTPUT:
+        2D numpy array (terms x points) of each term's value, rounds identically to Singularity_function.value
+    '''
+    # Compiled kernel fills the output in one pass when numba is available
+    kernels = jit_kernels()
+    if kernels is not None:
+        arrays = kernel_arrays(x, coeff, a, pow, eval_all_a)
+        values = np.empty([arrays[1].size, arrays[0].size])
+        kernels.term_values(*arrays, direction[0].lower() == 'n', values)
+        count('term_evaluations', values.size)
+        return values
+
+    # Work on terms sorted by power so each power step is a contiguous block of rows
+    order = np.argsort(pow, kind='stable')
+    if np.any(order != np.arange(order.size)):
+        values = term_values(x, coeff[order], a[order], pow[order], eval_all_a[order], direction)
+        return values[np.argsort(order)]
+
+    # Broadcast terms along rows and points along columns
+    x = np.asarray(x)[np.newaxis, :]
+    count('term_evaluations', a.size * x.size)
+    a = a[:, np.newaxis]
+
+    # Same a conditions as single_value
+    if direction[0].lower() == 'n':
+        inactive = x <= a
+    else:
+        inactive = x < a
+    inactive &= ~eval_all_a[:, np.newaxis]
+
+    # Same repeated multiplication as int_pow, each step only multiplies the rows that have not reached their power
+    base = x - a
+    values = base.copy()
+    starts = np.searchsorted(pow, np.arange(int(pow.max(initial=0)) + 2))
+    values[:starts[1]] = 1.0
+    for i in range(2, starts.size - 1):
+        values[starts[i]:] *= base[starts[i]:]
+
+    # Scale by coefficients and zero out inactive terms in place
+    values *= coeff[:, np.newaxis]
+    np.copyto(values, 0.0, where=inactive)
+    return values
+
+
+# Integrates many singularity functions at once from their packed coefficient and power arrays, same steps as Singularity_function.integrate
+def integrate_terms(coeff, pow, n=1):
+    '''
+    INPUT:
+        coeff, pow: 1D numpy arrays - coefficient and power of each term
+        n: int - number of integrations
+    OUTPUT:
+        coeff, pow: 1D numpy arrays after integrating
+    '''
+    coeff = np.array(coeff, dtype=float)
+    pow = np.array(pow, dtype=int)
+    for i in range(n):
+        pow += 1
+        coeff = np.where(pow > 0, coeff / np.maximum(pow, 1), coeff)
+    return coeff, pow
+
+
 class Singularity_function:
 
 
+    # Fixed attributes, no per object __dict__
+    __slots__ = ('coeff', 'a', 'pow', 'eval_all_a', 'state')
+
+
     # Initialize singularity function
     def __init__(self, **kwargs):
         
         ## Unpack Arguments
         # Manual 
         try:
-            # Unpack values
-            self.coeff = kwargs['coeff']
-            self.a = kwargs['a']
-            self.pow = kwargs['pow']
+            # Unpack values, set through object since instances are immutable
+            object.__setattr__(self, 'coeff', kwargs['coeff'])
+            object.__setattr__(self, 'a', kwargs['a'])
+            object.__setattr__(self, 'pow', kwargs['pow'])
             
             # Sanitize input
-            self.state = 'CUSTOM'
+            object.__setattr__(self, 'state', 'CUSTOM')
 
-        except:
-            raise('MUST PASS ARGUMENTS TO SINGULARITY FUNCTION:\n\tcoeff\n\ta\n\tpow')
+        except KeyError:
+            raise Exception('MUST PASS ARGUMENTS TO SINGULARITY FUNCTION:\n\tcoeff\n\ta\n\tpow')
 
         
-        self.eval_all_a = kwargs.get('eval_all_a', False)
+        object.__setattr__(self, 'eval_all_a', kwargs.get('eval_all_a', False))
         assert(self.pow % 1 == 0)
 
 
-    # Integrate singularity Function
+    # Integrate singularity Function, returns a new singularity function
     def integrate(self, n=1):
-
+        coeff = self.coeff
+        pow = self.pow
         for i in range(n):    
             # Update power
-            self.pow += 1
+            pow += 1
 
             # Update Coefficent
-            if self.pow > 0:
-                self.coeff /= self.pow
+            if pow > 0:
+                coeff = coeff / pow
 
-        return self
+        return Singularity_function(coeff=coeff, a=self.a, pow=pow, eval_all_a=self.eval_all_a)
 
 
-    # Take the derivitave of the singularity function
+    # Take the derivitave of the singularity function, returns a new singularity function
     def derivitave(self):
         
         # Update Coefficent
+        coeff = self.coeff
         if self.pow > 0:
-            self.coeff *= self.pow
+            coeff = coeff * self.pow
 
         # Update power:
-        self.pow -= 1
+        return Singularity_function(coeff=coeff, a=self.a, pow=self.pow - 1, eval_all_a=self.eval_all_a)
 
 
     # Returns value of the singularity function
     def value(self, x, direction='positive'):
         # Direction - Evaluate limit from negative or positive direction, changes behavior when x=a
+        count('Singularity_function.value')
         # Check if x is iterable
         iterable = True
         try:
@@ -83,21 +212,36 @@ class Singularity_function:
         
         # Iterable x values
         else:
-            # Cast to Np array, reassign values in same shape as x
-            x_np = np.array(x)
-            sol = np.zeros(x_np.size)
-            for i, xi in enumerate(x_np):
-                sol[i] = self.single_value(xi, direction)
+            # Cast to Np array, evaluate only where the term is active, keep the shape and float dtype of x
+            x_np = np.asarray(x)
+            sol = np.zeros(x_np.shape, dtype=x_np.dtype if np.issubdtype(x_np.dtype, np.floating) else float)
+            if self.pow < 0:
+                return sol
+            kernels = jit_kernels()
+            if kernels is not None and sol.dtype == np.float64 and isinstance(self.coeff, numbers.Real):
+                kernels.equation_values(*kernel_arrays(x_np.reshape(-1), [self.coeff], [self.a], [self.pow], [self.eval_all_a]), direction[0].lower() == 'n', sol.reshape(-1))
+                return sol
+            mask = self.active(x_np, direction)
+            sol[mask] = self.coeff * int_pow(x_np[mask] - self.a, self.pow)
             
         return sol
 
 
+    # Returns a boolean mask of the x values that pass the a conditions of single_value, used as a helper function for value
+    def active(self, x, direction='positive'):
+        if self.eval_all_a:
+            return np.ones(np.shape(x), dtype=bool)
+        if direction[0].lower() == 'n':
+            return ~(x <= self.a)
+        return ~(x < self.a)
+
+
     # Returns polynomial value If power is positive and x >= a, used as a helper function for value. Disregards a conditions if self.eval_all_a is true
     def single_value(self, x, direction):
         # Check for no value on power condition, x>a condition, or x=a, negative direction condition 
         if (self.pow < 0) or ((not self.eval_all_a) and ((x-self.a < 0) or (x==self.a and direction[0].lower()=='n'))):
             return 0
-        return self.coeff * (x - self.a) ** self.pow
+        return self.coeff * int_pow(x - self.a, self.pow)
             
 
     # return string representation of singularity function
@@ -119,7 +263,23 @@ class Singularity_function:
 
     # Objects equal if all parameters match
     def __eq__(self, other):
-            return (self.coeff == other.coeff) and (self.a == other.a) and (self.pow == other.pow)
+        if not isinstance(other, Singularity_function):
+            return NotImplemented
+        return (self.coeff == other.coeff) and (self.a == other.a) and (self.pow == other.pow) and (self.eval_all_a == other.eval_all_a)
+
+
+    # Hash on the same parameters as equality so terms can be shared in sets and dict keys
+    def __hash__(self):
+        return hash((self.coeff, self.a, self.pow, self.eval_all_a))
+
+
+    # Instances are immutable, calculus and arithmetic return new singularity functions
+    def __setattr__(self, name, value):
+        raise AttributeError(f'SINGULARITY FUNCTIONS ARE IMMUTABLE, CANNOT SET {name}')
+
+
+    def __delattr__(self, name):
+        raise AttributeError(f'SINGULARITY FUNCTIONS ARE IMMUTABLE, CANNOT DELETE {name}')
 
 
     # Compares a values, if the same, orders by lowest power
@@ -142,16 +302,7 @@ class Singularity_function:
         try:
             # Make sure is numeric
             assert(other*0 == 0)
-            # Copy self
-            temp = self.copy()
-            
-            # If nonprimative, copy other
-            if hasattr(other, "copy") and callable(getattr(other, "copy")):
-                other_processed = other.copy()
-            else:
-                other_processed = other
-            temp.coeff *= other_processed
-            return temp
+            return Singularity_function(coeff=self.coeff * other, a=self.a, pow=self.pow, eval_all_a=self.eval_all_a)
         except:
             raise Exception(f'ERROR: CANNOT MULTIPLY SING BY {other}')
 
@@ -159,20 +310,49 @@ class Singularity_function:
     def __truediv__(self, other):
         try:
             assert(other*0 == 0)
-            temp = self.copy()
-            temp.coeff /= other
-            return temp
+            return Singularity_function(coeff=self.coeff / other, a=self.a, pow=self.pow, eval_all_a=self.eval_all_a)
         except:
             raise Exception(f'ERROR: CANNOT DIVIDE SING BY {other}')
 
 
+    # Immutable, so a copy is the same object
     def copy(self):
-        self.coeff
-        # If nonprimative coeff, copy coeff
-        if hasattr(self.coeff, "copy") and callable(getattr(self.coeff, "copy")):
-            return Singularity_function(coeff = self.coeff.copy(), a = self.a, pow = self.pow)
-        else: 
-            return Singularity_function(coeff = self.coeff, a = self.a, pow = self.pow)
+        return self
+
+
+    # Binary layout of one term: magic, coeff, a, pow, eval_all_a, little endian and padded to 8 bytes
+    binary_format = struct.Struct('<4s4xddq?7x')
+    binary_magic = b'SGF1'
+
+
+    # Returns the term as bytes that from_bytes reads back exactly, only numeric terms can be written
+    def to_bytes(self):
+        try:
+            return self.binary_format.pack(self.binary_magic, float(np.squeeze(self.coeff)), float(self.a), int(self.pow), bool(self.eval_all_a))
+        except TypeError:
+            raise Exception('ONLY SINGULARITY FUNCTIONS WITH NUMERIC COEFF AND A CAN BE WRITTEN TO BYTES')
+
+
+    # Reads a term written by to_bytes, starting at offset in any bytes like buffer
+    @staticmethod
+    def from_bytes(buffer, offset=0):
+        magic, coeff, a, pow, eval_all_a = Singularity_function.binary_format.unpack_from(buffer, offset)
+        if magic != Singularity_function.binary_magic:
+            raise Exception('BUFFER DOES NOT HOLD A SINGULARITY FUNCTION')
+        return Singularity_function(coeff=coeff, a=a, pow=pow, eval_all_a=eval_all_a)
+
+
+    # Pickle support, __slots__ and the immutable __setattr__ need the constructor to rebuild
+    def __reduce__(self):
+        return (_rebuild, (self.coeff, self.a, self.pow, self.eval_all_a))
+
+
+
+
+
+# Rebuilds a pickled singularity function
+def _rebuild(coeff, a, pow, eval_all_a):
+    return Singularity_function(coeff=coeff, a=a, pow=pow, eval_all_a=eval_all_a)
 
 
 
@@ -180,13 +360,13 @@ class Singularity_function:
 
 # Test Functionality
 if __name__  == '__main__':
-    a = Singularity_function()
+    a = Singularity_function(coeff=1, a=250, pow=-1)
     print(f'Testing Integration:')
     for i in range(4):
         print(f'INTEGRATION #{i}')
         print(f'{a} = {a.value(300)} @ x = 300')
         print(f'At limit, {a.value(a.a)} @ x = {a}')
-        a.integrate()
+        a = a.integrate()
         print('\n')
     
     print(f'\nTesting iterable compatability')
@@ -207,7 +387,7 @@ if __name__  == '__main__':
     print(f'Testing integral and derivative preservation')
     c = Singularity_function(coeff=1, a=0, pow=0)
     for i in range(5):
-        c.integrate()
+        c = c.integrate()
         print(f'c: {c}')
 
     print('Testing Copy functionality')
@@ -216,5 +396,5 @@ if __name__  == '__main__':
     for i in range(5):
         print(f'\tDerivative {i}: {d}')
         print(f'\tCopy: {d2}')
-        d.derivitave()
+        d = d.derivitave()
 
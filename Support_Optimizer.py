@@ -0,0 +1,316 @@
+# Places supports to minimize peak deflection, peak moment, or reaction imbalance, using exact gradients with respect to support locations
+import os
+import copy
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Beam_Calculator import sing_calc, sing, support_system, sparse_support_system, INTEGRALS
+
+'''
+A design is a list of supports, each a dictionary with
+    loc: number for a support that stays put, or (lo, hi) for one free to move within those bounds
+    type: f/p, or a list of the types it may be, ex: ['p', 'f']
+Every combination of types is searched from several starting layouts, each start is a local search along the gradient
+Gradients come from the factorized support equations: A dx/dp = -(dA/dp x + dB/dp), no beam is rebuilt to estimate them
+Objectives:
+    shear, moment, slope, deflection: largest magnitude of the profile along the beam
+    reaction_balance: standard deviation of the support forces, zero when every support carries the same force
+'''
+
+
+# Names that can be minimized
+OBJECTIVES = list(INTEGRALS) + ['reaction_balance']
+
+
+# Derivatives of every reaction with respect to the location of every support
+def location_sensitivities(calc):
+    '''
+    INPUT:
+        calc: sing_calc - solved beam
+    OUTPUT:
+        dict with fields
+            labels: list of strings - names of the reactions, rows of d_reactions
+            d_reactions: 2D numpy array (reactions x supports) - change in each reaction per unit move of each support
+            system: support_system - dense support equations the derivatives were solved with
+    '''
+    # Derivatives are solved on the dense equations, whose rows are the support conditions themselves
+    system = calc.support_system()
+    if isinstance(system, sparse_support_system):
+        system = support_system(calc.bc, calc.l, calc.E, calc.I)
+    sols = np.asarray(calc.sols, dtype=float)
+    n_reactions = len(system.labels) - 4
+    owner = np.array([int(label[2:]) for label in system.labels[:n_reactions]], dtype=int)
+    G = np.zeros([len(system.labels), len(calc.bc)]) # dA/dp x + dB/dp, one column per support
+
+    # Moving a support shifts its terms, d/da f(x - a) = -f'(x - a), and f' is the term one integral lower
+    working_row = 0
+    for i, integral_locs in enumerate(system.x_eval):
+        n_locs = len(integral_locs)
+        lower = system.term_matrix(integral_locs, *system.packed_terms(i), limit=True)[:n_reactions]
+        block = np.zeros([len(calc.bc), n_locs])
+        np.add.at(block, owner, -lower * sols[:n_reactions, np.newaxis] / system.divide_factors[i])
+        G[working_row:working_row + n_locs] += block.T
+        working_row += n_locs
+
+    # The deflection and slope conditions at a support move with it, their rate of change is the next derivative there
+    slope = calc.get_profile('slope')
+    moment = calc.get_profile('moment')
+    for row, label in enumerate(system.row_labels):
+        if label.startswith('y_slope'):
+            k = int(label[7:])
+            loc = calc.bc[k]['loc']
+            G[row, k] += moment.value(loc, system.limit_direction(loc)) / (calc.E*calc.I)
+        elif label[0] == 'y':
+            k = int(label[1:])
+            loc = calc.bc[k]['loc']
+            G[row, k] += slope.value(loc, system.limit_direction(loc))
+
+    return {'labels': list(system.labels), 'd_reactions': system.solve(G), 'system': system}
+
+
+# Largest magnitude of a profile and its derivative with respect to the location of every support
+def extremum_sensitivity(calc, profile, sensitivities=None):
+    '''
+    INPUT:
+        calc: sing_calc - solved beam
+        profile: string - the name of the profile (shear, moment, slope, deflection)
+        sensitivities: optional dict - output of location_sensitivities for calc, computed if not given
+    OUTPUT:
+        dict with fields
+            max_abs: float - signed value of the profile with the largest magnitude
+            x_max_abs: float - location of that value
+            gradient: 1D numpy array - derivative of abs(max_abs) with respect to each support location
+    '''
+    if profile not in INTEGRALS:
+        raise AttributeError('INVALID PROFILE NAME, VALID NAMES ARE: \n\tshear\n\tmoment\n\tslope\n\tdeflection')
+    if sensitivities is None:
+        sensitivities = location_sensitivities(calc)
+    system = sensitivities['system']
+    n = INTEGRALS[profile]
+    divide = system.divide_factors[n - 1]
+    extrema = calc.extrema(profile)
+    x_peak = extrema['x_max_abs']
+    sols = np.asarray(calc.sols, dtype=float)
+    n_reactions = len(system.labels) - 4
+
+    # A peak on a jump is the limit from one side, every term is evaluated from that side
+    equation = calc.get_profile(profile)
+    direction = min(['positive', 'negative'], key=lambda side: abs(equation.value(x_peak, side) - extrema['max_abs']))
+
+    # At a fixed point the profile changes through the reactions and through the moved support terms
+    terms = system.term_matrix([x_peak], *system.packed_terms(n), direction=direction)[:, 0]
+    lower = system.term_matrix([x_peak], *system.packed_terms(n - 1), direction=direction)[:n_reactions, 0]
+    owner = np.array([int(label[2:]) for label in system.labels[:n_reactions]], dtype=int)
+    shift = np.zeros(len(calc.bc))
+    np.add.at(shift, owner, -lower * sols[:n_reactions])
+    gradient = (terms @ sensitivities['d_reactions'] + shift) / divide
+
+    # A peak sitting on a support moves with it, at the rate the profile changes along the beam on the peak's side
+    on_support = [k for k, supp in enumerate(calc.bc) if supp['loc'] == x_peak]
+    if on_support:
+        derivative = equation.copy()
+        derivative.derivative()
+        gradient[on_support] += derivative.value(x_peak, direction)
+
+    return {'max_abs': extrema['max_abs'], 'x_max_abs': x_peak, 'gradient': np.sign(extrema['max_abs']) * gradient}
+
+
+# Value of an objective and its derivative with respect to the location of every support
+def objective_gradient(calc, objective):
+    '''
+    INPUT:
+        calc: sing_calc - solved beam
+        objective: string - one of OBJECTIVES
+    OUTPUT:
+        (float, 1D numpy array) - objective value and its gradient
+    '''
+    sensitivities = location_sensitivities(calc)
+    if objective in INTEGRALS:
+        peak = extremum_sensitivity(calc, objective, sensitivities)
+        return abs(peak['max_abs']), peak['gradient']
+    if objective == 'reaction_balance':
+        forces = [j for j, label in enumerate(sensitivities['labels']) if label.startswith('Fr')]
+        F = np.asarray(calc.sols, dtype=float)[forces]
+        spread = np.std(F)
+        if spread == 0:
+            return 0.0, np.zeros(len(calc.bc))
+        return spread, (F - F.mean()) @ sensitivities['d_reactions'][forces] / (F.size * spread)
+    raise AttributeError(f'INVALID OBJECTIVE {objective}, VALID OBJECTIVES ARE: \n\t' + '\n\t'.join(OBJECTIVES))
+
+
+# Searches support locations and types for the layout that minimizes the objective, starting layouts are spread across a process pool
+def optimize_supports(beam, supports, objective='deflection', min_spacing=0, starts=8, processes=None, max_iterations=50, tolerance=1e-6, seed=0):
+    '''
+    INPUT:
+        beam: dict - sing_calc arguments other than bc (l, I, E, loading)
+        supports: iterable of dictionaries - the design, see the top of this file
+        objective: string - one of OBJECTIVES
+        min_spacing: numerical - closest two supports may be
+        starts: int - starting layouts per combination of support types, the first is the middle of every range
+        processes: optional int - number of worker processes, defaults to the number of cpus, 1 runs in this process
+        max_iterations: int - most gradient steps of each local search
+        tolerance: numerical - smallest step tried, as a fraction of the beam length
+        seed: int - seed of the random starting layouts
+    OUTPUT:
+        dict with fields
+            bc: list of dictionaries - best support layout
+            value: float - objective of the best layout
+            calc: sing_calc - the best layout solved
+            candidates: list of dicts with the types, start, locs, value, and iterations of every local search
+    '''
+    if objective not in OBJECTIVES:
+        raise AttributeError(f'INVALID OBJECTIVE {objective}, VALID OBJECTIVES ARE: \n\t' + '\n\t'.join(OBJECTIVES))
+    l = beam['l']
+
+    # Standardize the design into bounds and type options
+    bounds = np.zeros([len(supports), 2])
+    options = []
+    for k, supp in enumerate(supports):
+        loc = np.asarray(supp['loc'], dtype=float).reshape(-1)
+        if loc.size in (1, 2):
+            bounds[k] = [loc[0], loc[-1]]
+        if loc.size not in (1, 2) or not (0 <= bounds[k, 0] <= bounds[k, 1] <= l):
+            raise AttributeError(f'INVALID LOCATION FOR SUPPORT {supp}\nloc must be a number or (lo, hi) on the beam')
+        types = [supp['type']] if isinstance(supp['type'], str) else list(supp['type'])
+        options.append([])
+        for kind in types:
+            if str(kind).lower()[0] not in ('p', 'f'):
+                raise AttributeError(f'INVALID FORMAT FOR SUPPORT {supp}\nSupport type must be either p/pinned or f/fixed')
+            if str(kind).lower()[0] not in options[-1]:
+                options[-1].append(str(kind).lower()[0])
+
+    # Starting layouts: the middle of every range, then random layouts that respect the spacing
+    rng = np.random.default_rng(seed)
+    layouts = [bounds.mean(axis=1)]
+    for attempt in range(100 * starts):
+        if len(layouts) >= starts:
+            break
+        layout = rng.uniform(bounds[:, 0], bounds[:, 1])
+        if feasible(layout, min_spacing):
+            layouts.append(layout)
+    tasks = [(beam, types, layout, bounds, objective, min_spacing, max_iterations, tolerance) for types in itertools.product(*options) for layout in layouts]
+
+    # Local searches run in the workers in order, like Parameter_Sweep
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1:
+        candidates = [local_search(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            candidates = list(pool.map(local_search, *zip(*tasks), chunksize=max(1, -(-len(tasks) // (4 * processes)))))
+
+    best = min(candidates, key=lambda i: i['value'])
+    if not np.isfinite(best['value']):
+        raise Exception('NO FEASIBLE SUPPORT LAYOUT FOUND')
+    bc = layout_bc(best['types'], best['locs'])
+    return {'bc': bc, 'value': best['value'], 'calc': sing_calc(print_results=False, bc=bc, **beam), 'candidates': candidates}
+
+
+# Descends the gradient from one starting layout, each step is backtracked until it lowers the objective and keeps the supports apart
+def local_search(beam, types, start, bounds, objective, min_spacing, max_iterations, tolerance):
+    '''
+    INPUT:
+        beam, bounds, objective, min_spacing, max_iterations, tolerance: see optimize_supports
+        types: tuple of strings - type of each support
+        start: 1D numpy array - starting location of each support
+    OUTPUT:
+        dict with fields types, start, locs, value, iterations
+    '''
+    l = beam['l']
+    locs = np.clip(np.asarray(start, dtype=float), bounds[:, 0], bounds[:, 1])
+    result = {'types': tuple(types), 'start': locs.copy(), 'locs': locs, 'value': np.inf, 'iterations': 0}
+    calc = solve_layout(beam, types, locs)
+    if calc is None or not feasible(locs, min_spacing):
+        return result
+    value, gradient = objective_gradient(calc, objective)
+    free = bounds[:, 1] > bounds[:, 0]
+    step = 0.1 * max(np.max(bounds[:, 1] - bounds[:, 0]), tolerance * l)
+
+    for iteration in range(max_iterations):
+        # Steps are scaled so the support moving furthest moves by step, the projected gradient is zero at a bound it pushes against
+        direction = -gradient * free
+        direction[(locs <= bounds[:, 0]) & (direction < 0)] = 0
+        direction[(locs >= bounds[:, 1]) & (direction > 0)] = 0
+        if not np.any(direction):
+            break
+        direction /= np.max(np.abs(direction))
+
+        moved = False
+        while step > tolerance * l:
+            trial = np.clip(locs + step * direction, bounds[:, 0], bounds[:, 1])
+            if feasible(trial, min_spacing):
+                # Edited from the current beam so a few moved supports reuse its factorization
+                trial_calc = copy.copy(calc)
+                trial_value = np.inf
+                try:
+                    trial_calc.update_supports(layout_bc(types, trial))
+                    if np.all(np.isfinite(trial_calc.sols)): # Layouts that cannot hold the beam are infeasible
+                        trial_value, trial_gradient = objective_gradient(trial_calc, objective)
+                except (np.linalg.LinAlgError, ValueError):
+                    pass
+                if trial_value < value:
+                    calc, locs, value, gradient = trial_calc, trial, trial_value, trial_gradient
+                    step *= 1.5
+                    moved = True
+                    break
+            step *= 0.5
+        result['iterations'] = iteration + 1
+        if not moved:
+            break
+
+    result['locs'] = locs
+    result['value'] = value
+    return result
+
+
+# Solves one layout, None if its supports cannot hold the beam
+def solve_layout(beam, types, locs):
+    try:
+        calc = sing_calc(print_results=False, bc=layout_bc(types, locs), **beam)
+    except (np.linalg.LinAlgError, ValueError):
+        return None
+    if not np.all(np.isfinite(calc.sols)):
+        return None
+    return calc
+
+
+# Support dictionaries of a layout
+def layout_bc(types, locs):
+    return [{'loc': float(loc), 'type': kind} for kind, loc in zip(types, locs)]
+
+
+# Whether every pair of supports is at least min_spacing apart
+def feasible(locs, min_spacing):
+    return locs.size < 2 or np.min(np.diff(np.sort(locs))) >= min_spacing
+
+
+
+
+
+# Test Function
+if __name__ == '__main__':
+    import time
+
+    # Shaft from Run_Beam_Calc.py with the two outer bearings free to move and the inner bearing either pinned or fixed
+    l1, l2, l3 = 0.02375, 0.0314, 0.028
+    l = l1+l2+l3
+    beam = {
+        'l': l,
+        'E': 71.7*10**9,
+        'I': sing_calc.I(shape='circle', dims=0.03),
+        'loading': [
+            sing(coeff=3396.24, a=l1+l2, pow=-1), # Force
+            sing(coeff=274, a=l1+l2, pow=-2), # Moment
+            ],
+        }
+    supports = [
+        {'loc': (0.6*l, l), 'type': 'p'},
+        {'loc': (0, 0.4*l), 'type': 'p'},
+        {'loc': 0, 'type': ['p', 'f']},
+        ]
+
+    start = time.perf_counter()
+    result = optimize_supports(beam, supports, objective='deflection', min_spacing=0.005, processes=1)
+    print(f'{len(result["candidates"])} local searches: {time.perf_counter() - start:.3f}s')
+    print(f'Best layout: {result["bc"]}')
+    print(f'Peak deflection: {result["value"]}')